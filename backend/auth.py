@@ -1,38 +1,63 @@
 """
 Система авторизации для панели управления ботами
 """
+import asyncio
 import bcrypt
+import hmac
+import time
 from datetime import datetime
 from fastapi import HTTPException, Request
 from itsdangerous import URLSafeTimedSerializer
 from backend.config import SECRET_KEY, SESSION_COOKIE_NAME, SESSION_COOKIE_MAX_AGE, get_admin_password_hash
 
 serializer = URLSafeTimedSerializer(SECRET_KEY)
+# Подписчик создаем один раз и переиспользуем для всех токенов (формат токенов не меняется)
+_session_signer = serializer.make_signer()
 
 def verify_password(password: str) -> bool:
     """Проверка пароля"""
     try:
         # Получаем актуальный хеш (на случай, если пароль был изменен)
         current_hash = get_admin_password_hash()
-        return bcrypt.checkpw(password.encode(), current_hash.encode())
+        # Сравниваем за постоянное время независимо от реализации checkpw в bcrypt
+        return hmac.compare_digest(bcrypt.hashpw(password.encode(), current_hash), current_hash)
     except Exception:
         return False
 
+async def verify_password_async(password: str) -> bool:
+    """Проверка пароля в пуле потоков, чтобы bcrypt не блокировал event loop"""
+    return await asyncio.to_thread(verify_password, password)
+
 def create_session_token() -> str:
     """Создание токена сессии"""
     data = {
         'timestamp': datetime.utcnow().isoformat(),
         'user': 'admin'
     }
-    return serializer.dumps(data)
+    return _session_signer.sign(serializer.dump_payload(data)).decode('utf-8')
+
+# Кэш проверенных токенов: токен -> время истечения (unix timestamp)
+_session_token_cache = {}
+_SESSION_TOKEN_CACHE_SIZE = 4096
 
 def verify_session_token(token: str) -> bool:
     """Проверка токена сессии"""
+    expires_at = _session_token_cache.get(token)
+    if expires_at is not None:
+        if time.time() < expires_at:
+            return True
+        _session_token_cache.pop(token, None)
+    
     try:
-        serializer.loads(token, max_age=SESSION_COOKIE_MAX_AGE)
-        return True
+        # Для проверки достаточно подписи и времени, payload не декодируем
+        _, signed_at = _session_signer.unsign(token, max_age=SESSION_COOKIE_MAX_AGE, return_timestamp=True)
     except Exception:
         return False
+    
+    if len(_session_token_cache) >= _SESSION_TOKEN_CACHE_SIZE:
+        _session_token_cache.clear()
+    _session_token_cache[token] = signed_at.timestamp() + SESSION_COOKIE_MAX_AGE
+    return True
 
 def get_session_from_request(request: Request) -> str | None:
     """Получение токена сессии из запроса"""
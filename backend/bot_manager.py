@@ -1,16 +1,47 @@
 """
 Управление процессами ботов
 """
+import hashlib
 import subprocess
 import os
+import re
+import signal
 import sys
+import threading
 import psutil
+from datetime import datetime
 from pathlib import Path
 from typing import Optional, Dict, Any, Tuple
 
 from backend.database import get_bot, update_bot
-from backend.config import BOTS_DIR
-from backend.git_manager import is_git_repo, update_bot_from_git
+from backend.config import BOTS_DIR, DATA_DIR
+from backend.git_manager import update_bot_from_git
+
+_IS_WINDOWS = sys.platform == 'win32'
+
+# Строки лога с сигнатурой ошибки (итоговая строка traceback, ошибки Node, занятый порт)
+_ERROR_LINE_RE = re.compile(r"^[\w.]*(?:Error|Exception)\b.*$|^.*address already in use.*$", re.MULTILINE)
+
+def _now_iso() -> str:
+    """Текущее время в ISO формате с точностью до секунд"""
+    return datetime.now().isoformat(timespec='seconds')
+
+# Окружение для процессов ботов и pip: без переменных прокси, с NO_PROXY для отключения прокси
+_PROXY_VARS = {'HTTP_PROXY', 'HTTPS_PROXY', 'http_proxy', 'https_proxy', 'ALL_PROXY', 'all_proxy'}
+_BOT_ENV = {k: v for k, v in os.environ.items() if k not in _PROXY_VARS}
+_BOT_ENV['NO_PROXY'] = '*'
+
+# Для pip дополнительно используем общий кэш колес, чтобы не скачивать пакеты для каждого бота заново
+_PIP_ENV = dict(_BOT_ENV, PIP_CACHE_DIR=str(DATA_DIR / "pip-cache"))
+
+# pip не рассчитан на параллельную установку в одно окружение (при автозапуске ботов
+# несколько start_bot идут в потоках одновременно) - установки выполняются по очереди
+_PIP_LOCK = threading.Lock()
+
+def _has_user_files(bot_dir: Path) -> bool:
+    """Проверка, есть ли в директории бота файлы помимо служебных"""
+    with os.scandir(bot_dir) as entries:
+        return any(entry.name not in ('.gitkeep', 'config.json') for entry in entries)
 
 def start_bot(bot_id: int) -> Tuple[bool, Optional[str]]:
     """Запуск бота"""
@@ -29,8 +60,7 @@ def start_bot(bot_id: int) -> Tuple[bool, Optional[str]]:
     
     # Если директория пустая и есть Git репозиторий, пытаемся клонировать
     if bot.get('git_repo_url'):
-        files = [f for f in bot_dir.iterdir() if f.name not in ['.gitkeep', 'config.json']]
-        if not files or (len(files) == 0 and not is_git_repo(bot_dir)):
+        if not _has_user_files(bot_dir):
             repo_url = bot['git_repo_url']
             branch = bot.get('git_branch', 'main')
             success, message = update_bot_from_git(bot_dir, repo_url, branch)
@@ -45,14 +75,19 @@ def start_bot(bot_id: int) -> Tuple[bool, Optional[str]]:
     update_bot(bot_id, status='starting')
     
     # Автоматически устанавливаем зависимости из requirements.txt
+    # (пропускаем pip, если файл не изменился с последней успешной установки)
     requirements_file = bot_dir / "requirements.txt"
+    requirements_hash = None
     if requirements_file.exists():
+        requirements_hash = hashlib.sha256(requirements_file.read_bytes()).hexdigest()
+    if requirements_hash and requirements_hash != bot.get('requirements_hash'):
         update_bot(bot_id, status='installing')
         try:
             success = install_dependencies(str(bot_dir))
             if not success:
                 update_bot(bot_id, status='error_startup')
                 return (False, "Не удалось установить зависимости из requirements.txt")
+            update_bot(bot_id, requirements_hash=requirements_hash)
         except Exception as e:
             error_msg = str(e)
             update_bot(bot_id, status='error_startup')
@@ -70,29 +105,16 @@ def start_bot(bot_id: int) -> Tuple[bool, Optional[str]]:
     try:
         # Запускаем процесс в директории бота
         # Для Windows используем CREATE_NEW_PROCESS_GROUP, для Unix - start_new_session
-        import platform
-        creation_flags = 0
-        if platform.system() == 'Windows':
-            creation_flags = subprocess.CREATE_NEW_PROCESS_GROUP
-        else:
-            start_new_session = True
-        
         # Изначально задаем PIPE, но потом изменим на файлы
         kwargs = {
             'cwd': str(bot_dir),
         }
         
-        # Удаляем переменные прокси из окружения для процесса бота
-        env = os.environ.copy()
-        proxy_vars = ['HTTP_PROXY', 'HTTPS_PROXY', 'http_proxy', 'https_proxy', 'ALL_PROXY', 'all_proxy']
-        for var in proxy_vars:
-            env.pop(var, None)
-        # Устанавливаем NO_PROXY для отключения прокси
-        env['NO_PROXY'] = '*'
-        kwargs['env'] = env
+        # Окружение без переменных прокси подготовлено заранее
+        kwargs['env'] = _BOT_ENV
         
-        if platform.system() == 'Windows':
-            kwargs['creationflags'] = creation_flags
+        if _IS_WINDOWS:
+            kwargs['creationflags'] = subprocess.CREATE_NEW_PROCESS_GROUP
         else:
             kwargs['start_new_session'] = True
         
@@ -101,20 +123,22 @@ def start_bot(bot_id: int) -> Tuple[bool, Optional[str]]:
         log_dir.mkdir(exist_ok=True)
         log_path = log_dir / "bot.log"
         
-        # Очищаем старый лог при запуске бота
-        # Сначала открываем в режиме "w" для очистки, затем закрываем
+        # Очищаем старый лог при запуске бота одним вызовом truncate
         # Затем открываем в режиме "a" (append), чтобы можно было читать файл одновременно
-        if log_path.exists():
-            with open(log_path, "w", encoding="utf-8") as f:
-                pass  # Очищаем файл
+        try:
+            os.truncate(log_path, 0)
+        except FileNotFoundError:
+            pass
         
         # Открываем файл в режиме добавления для процесса
-        log_file = open(log_path, "a", encoding="utf-8", buffering=1)
+        # Блочный буфер вместо построчного: процесс пишет напрямую в дескриптор,
+        # буфер Python используется только для строки-заголовка
+        log_file = open(log_path, "ab", buffering=65536)
         
         # Записываем метку времени начала запуска
-        from datetime import datetime
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        log_file.write(f"Bot {bot_id} started at {timestamp}\n")
+        log_file.write(f"Bot {bot_id} started at {timestamp}\n".encode("utf-8"))
+        # Сбрасываем заголовок до запуска процесса, чтобы он оказался в начале лога
         log_file.flush()
         
         # Перенаправляем stdout и stderr в один файл
@@ -124,12 +148,8 @@ def start_bot(bot_id: int) -> Tuple[bool, Optional[str]]:
         process = subprocess.Popen(cmd, **kwargs)
         # Если закрыть их, процесс не сможет писать в них
         
-        # Небольшая задержка для проверки, что процесс запустился
-        import time
-        time.sleep(1.5)
-        
-        # Проверяем, что процесс еще работает
-        if process.poll() is not None:
+        # Ждем до 1.5 секунды: если процесс сразу упадет, узнаем об этом без задержки
+        if _wait_for_exit(process, 1.5):
             exit_code = process.returncode
             
             try:
@@ -137,16 +157,14 @@ def start_bot(bot_id: int) -> Tuple[bool, Optional[str]]:
             except:
                 pass
             
-            log_output = ""
-            try:
-                if log_path.exists() and log_path.stat().st_size > 0:
-                    log_output = log_path.read_text(encoding="utf-8", errors='ignore')
-            except Exception:
-                pass
+            log_output = read_log_tail(log_path)
             
-            # Извлекаем основную ошибку
-            if log_output:
-                error_msg = f"Exit code {exit_code}\n{log_output[-2000:]}"
+            # Извлекаем основную ошибку и выносим ее в начало сообщения
+            error_line = extract_error_line(log_output)
+            if log_output and error_line:
+                error_msg = f"Exit code {exit_code}: {error_line}\n{log_output}"
+            elif log_output:
+                error_msg = f"Exit code {exit_code}\n{log_output}"
             else:
                 error_msg = f"Process exited immediately with code {exit_code}. Check logs in {log_dir}"
             
@@ -158,14 +176,12 @@ def start_bot(bot_id: int) -> Tuple[bool, Optional[str]]:
             pass
         
         # Записываем дату запуска
-        from datetime import datetime
-        current_time = datetime.now().isoformat()
+        current_time = _now_iso()
         update_bot(bot_id, pid=process.pid, status='running', started_at=current_time, last_started_at=current_time)
         
-        time.sleep(2.0)
-        if process.poll() is not None:
+        if _wait_for_exit(process, 2.0):
             exit_code = process.returncode
-            current_time = datetime.now().isoformat()
+            current_time = _now_iso()
             update_bot(bot_id, pid=None, status='stopped', started_at=None, last_crashed_at=current_time, last_stopped_at=current_time)
             
             try:
@@ -173,15 +189,13 @@ def start_bot(bot_id: int) -> Tuple[bool, Optional[str]]:
             except:
                 pass
             
-            log_output = ""
-            try:
-                if log_path.exists() and log_path.stat().st_size > 0:
-                    log_output = log_path.read_text(encoding="utf-8", errors='ignore')
-            except Exception:
-                pass
+            log_output = read_log_tail(log_path)
             
-            if log_output:
-                error_msg = f"Process exited after startup (code {exit_code}):\n{log_output[-2000:]}"
+            error_line = extract_error_line(log_output)
+            if log_output and error_line:
+                error_msg = f"Process exited after startup (code {exit_code}): {error_line}\n{log_output}"
+            elif log_output:
+                error_msg = f"Process exited after startup (code {exit_code}):\n{log_output}"
             else:
                 error_msg = f"Process exited after startup with code {exit_code}. Check logs in {log_dir}"
             
@@ -193,6 +207,37 @@ def start_bot(bot_id: int) -> Tuple[bool, Optional[str]]:
         update_bot(bot_id, status='error_startup', pid=None)
         return (False, error_msg)
 
+def _wait_for_exit(process: subprocess.Popen, timeout: float) -> bool:
+    """Ожидание завершения процесса; True, если процесс завершился за timeout секунд"""
+    try:
+        process.wait(timeout=timeout)
+        return True
+    except subprocess.TimeoutExpired:
+        return False
+
+def extract_error_line(log_output: str) -> Optional[str]:
+    """Поиск последней строки лога с сигнатурой ошибки"""
+    error_line = None
+    for match in _ERROR_LINE_RE.finditer(log_output):
+        error_line = match.group(0).strip()
+    return error_line
+
+def read_log_tail(log_path: Path, max_bytes: int = 2000) -> str:
+    """Чтение последних max_bytes байт лога без загрузки всего файла в память"""
+    try:
+        fd = os.open(log_path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+    except OSError:
+        return ""
+    try:
+        size = os.fstat(fd).st_size
+        os.lseek(fd, max(0, size - max_bytes), os.SEEK_SET)
+        data = os.read(fd, max_bytes)
+    except OSError:
+        return ""
+    finally:
+        os.close(fd)
+    return data.decode("utf-8", errors="ignore")
+
 def stop_bot(bot_id: int) -> bool:
     """Остановка бота"""
     bot = get_bot(bot_id)
@@ -213,32 +258,34 @@ def stop_bot(bot_id: int) -> bool:
         # Получаем процесс
         process = psutil.Process(pid)
         
-        # Останавливаем процесс и все дочерние процессы
-        try:
-            children = process.children(recursive=True)
-            for child in children:
-                try:
-                    child.terminate()
-                except psutil.NoSuchProcess:
-                    pass
-            
-            process.terminate()
-            
-            # Ждем завершения (5 секунд)
+        # На Unix бот запущен в собственной сессии (start_new_session=True), поэтому
+        # вся группа процессов завершается одним вызовом killpg
+        pgid = None
+        if not _IS_WINDOWS:
+            try:
+                pgid = os.getpgid(pid)
+            except OSError:
+                pgid = None
+            # Не трогаем группу, если процесс не является ее лидером (например, группа панели)
+            if pgid != pid:
+                pgid = None
+        
+        if pgid is not None:
             try:
-                process.wait(timeout=5)
-            except psutil.TimeoutExpired:
-                # Если не завершился, убиваем принудительно
+                os.killpg(pgid, signal.SIGTERM)
+                # Ждем завершения (5 секунд)
                 try:
-                    process.kill()
-                except psutil.NoSuchProcess:
-                    pass
-        except psutil.NoSuchProcess:
-            pass
+                    process.wait(timeout=5)
+                except psutil.TimeoutExpired:
+                    # Если не завершился, убиваем всю группу принудительно
+                    os.killpg(pgid, signal.SIGKILL)
+            except (ProcessLookupError, psutil.NoSuchProcess):
+                pass
+        else:
+            _terminate_process_tree(process)
         
         # Записываем дату остановки
-        from datetime import datetime
-        current_time = datetime.now().isoformat()
+        current_time = _now_iso()
         # Обновляем статус
         update_bot(bot_id, pid=None, status='stopped', started_at=None, last_stopped_at=current_time)
         # Очищаем кэш CPU для этого PID
@@ -247,14 +294,37 @@ def stop_bot(bot_id: int) -> bool:
         return True
         
     except Exception as e:
-        from datetime import datetime
-        current_time = datetime.now().isoformat()
+        current_time = _now_iso()
         update_bot(bot_id, pid=None, status='stopped', started_at=None, last_stopped_at=current_time)
         # Очищаем кэш CPU для этого PID
         if pid in _cpu_percent_cache:
             del _cpu_percent_cache[pid]
         return False
 
+def _terminate_process_tree(process: psutil.Process):
+    """Остановка процесса и всех дочерних процессов через psutil (Windows)"""
+    try:
+        children = process.children(recursive=True)
+        for child in children:
+            try:
+                child.terminate()
+            except psutil.NoSuchProcess:
+                pass
+        
+        process.terminate()
+        
+        # Ждем завершения (5 секунд)
+        try:
+            process.wait(timeout=5)
+        except psutil.TimeoutExpired:
+            # Если не завершился, убиваем принудительно
+            try:
+                process.kill()
+            except psutil.NoSuchProcess:
+                pass
+    except psutil.NoSuchProcess:
+        pass
+
 def install_dependencies(bot_dir: str) -> bool:
     """Установка зависимостей из requirements.txt"""
     requirements_file = Path(bot_dir) / "requirements.txt"
@@ -266,25 +336,20 @@ def install_dependencies(bot_dir: str) -> bool:
             sys.executable, "-m", "pip", "install", 
             "--trusted-host", "pypi.org",
             "--trusted-host", "files.pythonhosted.org",
+            "--prefer-binary",
             "-r", str(requirements_file)
         ]
         
-        env = os.environ.copy()
-        env.pop('HTTP_PROXY', None)
-        env.pop('HTTPS_PROXY', None)
-        env.pop('http_proxy', None)
-        env.pop('https_proxy', None)
-        env['NO_PROXY'] = '*'
-        
-        result = subprocess.run(
-            cmd,
-            cwd=bot_dir,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            timeout=300,
-            text=True,
-            env=env
-        )
+        with _PIP_LOCK:
+            result = subprocess.run(
+                cmd,
+                cwd=bot_dir,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                timeout=300,
+                text=True,
+                env=_PIP_ENV
+            )
         
         if result.returncode != 0:
             error_msg = result.stdout if result.stdout else "Неизвестная ошибка"
@@ -299,16 +364,67 @@ def install_dependencies(bot_dir: str) -> bool:
 
 def is_process_running(pid: int) -> bool:
     """Проверка, запущен ли процесс"""
+    if _IS_WINDOWS:
+        # На Windows os.kill завершает процесс, поэтому используем psutil
+        try:
+            process = psutil.Process(pid)
+            return process.is_running() and process.status() != psutil.STATUS_ZOMBIE
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            return False
+    
+    # Сигнал 0 только проверяет существование процесса, без создания объекта psutil
     try:
-        process = psutil.Process(pid)
-        # Проверяем, что процесс существует и это не зомби
-        return process.is_running() and process.status() != psutil.STATUS_ZOMBIE
-    except (psutil.NoSuchProcess, psutil.AccessDenied):
+        os.kill(pid, 0)
+    except ProcessLookupError:
         return False
+    except PermissionError:
+        # Процесс существует, но принадлежит другому пользователю
+        return True
+    except OSError:
+        return False
+    
+    # Проверяем, что это не зомби (состояние - третье поле /proc/<pid>/stat)
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as f:
+            stat = f.read()
+        state_pos = stat.rfind(b")") + 2
+        return stat[state_pos:state_pos + 1] != b"Z"
+    except OSError:
+        return True
 
-# Кэш для хранения предыдущих значений cpu_percent по PID
+def get_running_pids() -> Optional[set]:
+    """Получение множества PID всех процессов одним чтением /proc (None, если /proc недоступен)"""
+    try:
+        return {int(name) for name in os.listdir("/proc") if name.isdigit()}
+    except OSError:
+        return None
+
+# Последние значения cpu_percent по PID (заполняется фоновой задачей cpu_sampler)
 _cpu_percent_cache = {}
 
+def start_cpu_sampling(pids) -> Dict[int, psutil.Process]:
+    """Начало замера CPU: первый вызов cpu_percent для каждого процесса"""
+    processes = {}
+    for pid in pids:
+        try:
+            process = psutil.Process(pid)
+            process.cpu_percent(interval=None)
+            processes[pid] = process
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            pass
+    return processes
+
+def finish_cpu_sampling(processes: Dict[int, psutil.Process]):
+    """Завершение замера CPU: сохранение значений за прошедший интервал в кэш"""
+    samples = {}
+    for pid, process in processes.items():
+        try:
+            samples[pid] = process.cpu_percent(interval=None)
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            pass
+    _cpu_percent_cache.clear()
+    _cpu_percent_cache.update(samples)
+
 def get_bot_process_info(bot_id: int) -> Optional[Dict]:
     """Получение информации о процессе бота"""
     bot = get_bot(bot_id)
@@ -318,41 +434,20 @@ def get_bot_process_info(bot_id: int) -> Optional[Dict]:
     pid = bot['pid']
     
     try:
-        if not is_process_running(pid):
-            # Процесс не запущен, обновляем статус
-            update_bot(bot_id, pid=None, status='stopped')
-            if pid in _cpu_percent_cache:
-                del _cpu_percent_cache[pid]
-            return None
-        
+        # Отдельная проверка is_process_running не нужна: отсутствие процесса
+        # обрабатывается через psutil.NoSuchProcess ниже
         process = psutil.Process(pid)
         
-        # Получаем метрики CPU
-        # cpu_percent требует двух вызовов - первый инициализирует, второй возвращает значение
-        # Используем кэш для хранения предыдущего значения, чтобы не терять его между вызовами
-        try:
-            if pid not in _cpu_percent_cache:
-                # Первый вызов для инициализации (вернет 0.0 или None)
-                process.cpu_percent(interval=None)
-                # Используем 0.0 для первого раза
-                cpu_percent = 0.0
-                _cpu_percent_cache[pid] = 0.0
-            else:
-                # Второй и последующие вызовы возвращают реальное значение
-                # Используем interval=None для мгновенного значения (быстрее)
-                cpu_percent = process.cpu_percent(interval=None)
-                if cpu_percent is None:
-                    # Если None, используем предыдущее значение
-                    cpu_percent = _cpu_percent_cache.get(pid, 0.0)
-                else:
-                    # Сохраняем значение в кэш
-                    _cpu_percent_cache[pid] = cpu_percent
-        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.TimeoutExpired):
-            cpu_percent = _cpu_percent_cache.get(pid, 0.0)
-        
-        memory_info = process.memory_info()
+        # oneshot() кэширует чтение /proc на время блока, все метрики берутся за один проход
+        with process.oneshot():
+            if process.status() == psutil.STATUS_ZOMBIE:
+                raise psutil.NoSuchProcess(pid)
+            memory_info = process.memory_info()
         memory_mb = memory_info.rss / (1024 * 1024)  # RSS в MB
         
+        # CPU замеряется пакетно фоновой задачей cpu_sampler, здесь только читаем результат
+        cpu_percent = _cpu_percent_cache.get(pid, 0.0)
+        
         return {
             "pid": pid,
             "cpu_percent": cpu_percent,
@@ -373,7 +468,7 @@ def apply_resource_limits(pid: int, cpu_limit: float, memory_limit_mb: int):
         process = psutil.Process(pid)
         
         # На Windows возможности ограничены, но можем попробовать установить приоритет
-        if sys.platform == 'win32':
+        if _IS_WINDOWS:
             # Устанавливаем низкий приоритет процесса (эффективно ограничивает CPU)
             try:
                 # Пытаемся использовать win32api если доступен
@@ -409,29 +504,41 @@ def apply_resource_limits(pid: int, cpu_limit: float, memory_limit_mb: int):
     except (psutil.NoSuchProcess, psutil.AccessDenied):
         pass
 
-def restore_bot_states():
+# Максимальное количество ботов, запускаемых одновременно при автозапуске
+AUTOSTART_CONCURRENCY = 4
+
+async def restore_bot_states():
     """Восстановление состояния ботов при запуске панели"""
-    from backend.database import get_all_bots
+    from backend.database import get_all_bots, update_bots_status_bulk
+    import asyncio
     import logging
-    import time
     
     logger = logging.getLogger(__name__)
     
     bots = get_all_bots()
+    # Считываем список процессов один раз для всех ботов
+    running_pids = get_running_pids()
+    stopped_rows = []
     for bot in bots:
         if bot['status'] == 'running' and bot['pid']:
             # Проверяем, действительно ли процесс запущен
-            if not is_process_running(bot['pid']):
-                # Процесс не запущен, обновляем статус
-                update_bot(bot['id'], pid=None, status='stopped')
+            if running_pids is not None:
+                alive = bot['pid'] in running_pids
+            else:
+                alive = is_process_running(bot['pid'])
+            if not alive:
+                # Процесс не запущен, статус обновим одной транзакцией для всех таких ботов
+                stopped_rows.append(('stopped', None, bot['id']))
             else:
                 try:
                     apply_resource_limits(bot['pid'], bot.get('cpu_limit', 50.0), bot.get('memory_limit', 512))
                 except Exception:
                     pass
+    update_bots_status_bulk(stopped_rows)
     
     # Автозапуск ботов с включенным auto_start
     logger.info("Проверка ботов для автозапуска...")
+    autostart_bots = []
     for bot in bots:
         auto_start = bot.get('auto_start', 0)
         # Преобразуем в int, если это bool или None
@@ -443,15 +550,21 @@ def restore_bot_states():
             auto_start = int(auto_start) if auto_start else 0
         
         if auto_start and bot['status'] == 'stopped':
+            autostart_bots.append(bot)
+    
+    # Запускаем ботов параллельно в пуле потоков, ограничивая число одновременных запусков
+    semaphore = asyncio.Semaphore(AUTOSTART_CONCURRENCY)
+    
+    async def autostart(bot):
+        async with semaphore:
             logger.info(f"Автозапуск бота {bot['name']} (ID: {bot['id']})...")
             try:
-                success, message = start_bot(bot['id'])
+                success, message = await asyncio.to_thread(start_bot, bot['id'])
                 if success:
                     logger.info(f"Бот {bot['name']} успешно запущен автоматически")
-                    # Небольшая задержка между запусками ботов
-                    time.sleep(1)
                 else:
                     logger.warning(f"Не удалось автоматически запустить бота {bot['name']}: {message}")
             except Exception as e:
                 logger.error(f"Ошибка при автозапуске бота {bot['name']}: {e}", exc_info=True)
-
+    
+    await asyncio.gather(*(autostart(bot) for bot in autostart_bots))
@@ -2,6 +2,7 @@
 Конфигурация панели управления ботами
 """
 import os
+import time
 from pathlib import Path
 import bcrypt
 
@@ -12,45 +13,94 @@ DATA_DIR = BASE_DIR / "data"
 DATA_DIR.mkdir(exist_ok=True)
 BOTS_DIR.mkdir(exist_ok=True)
 
-# База данных панели
-PANEL_DB_PATH = DATA_DIR / "panel.db"
+# База данных панели (PANEL_DB=:memory: - БД в памяти, для тестов и CI)
+PANEL_DB_PATH = Path(os.getenv("PANEL_DB", str(DATA_DIR / "panel.db")))
 
 # Файл для хранения хеша пароля администратора
 ADMIN_PASSWORD_FILE = DATA_DIR / "admin_password.hash"
 
-def get_admin_password_hash() -> str:
+# Стоимость bcrypt (0 - подобрать автоматически по времени хеширования)
+BCRYPT_COST = int(os.getenv("BCRYPT_COST", "0"))
+BCRYPT_TARGET_MS = float(os.getenv("BCRYPT_TARGET_MS", "150"))
+BCRYPT_MIN_COST = 10
+BCRYPT_MAX_COST = 14
+
+def get_bcrypt_cost() -> int:
+    """Получение стоимости bcrypt (при первом вызове калибруется по времени хеширования)"""
+    global BCRYPT_COST
+    if BCRYPT_COST > 0:
+        return BCRYPT_COST
+    
+    # Выбираем максимальную стоимость, укладывающуюся в целевое время
+    cost = BCRYPT_MIN_COST
+    for rounds in range(BCRYPT_MIN_COST, BCRYPT_MAX_COST + 1):
+        start = time.perf_counter()
+        bcrypt.hashpw(b"x", bcrypt.gensalt(rounds=rounds))
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if elapsed_ms > BCRYPT_TARGET_MS:
+            break
+        cost = rounds
+    
+    BCRYPT_COST = cost
+    return cost
+
+# Хеш из переменной окружения кодируем в bytes один раз при загрузке
+_ENV_PASSWORD_HASH = os.getenv("ADMIN_PASSWORD_HASH", "").encode() or None
+
+# Кэш хеша пароля администратора (инвалидируется по mtime файла).
+# Неизменяемый кортеж (mtime, hash) заменяется одним присваиванием: потоки из asyncio.to_thread
+# не увидят новый mtime вместе со старым хешем
+_hash_cache = (0, None)
+
+def get_admin_password_hash() -> bytes:
     """Получение хеша пароля администратора из файла или переменной окружения"""
+    global _hash_cache
     # Сначала проверяем переменную окружения
-    env_hash = os.getenv("ADMIN_PASSWORD_HASH")
-    if env_hash:
-        return env_hash
+    if _ENV_PASSWORD_HASH:
+        return _ENV_PASSWORD_HASH
+    
+    # Затем проверяем файл (повторно читаем только если файл изменился)
+    try:
+        mtime = os.stat(ADMIN_PASSWORD_FILE).st_mtime_ns
+    except OSError:
+        mtime = None
     
-    # Затем проверяем файл
-    if ADMIN_PASSWORD_FILE.exists():
+    if mtime is not None:
+        cached_mtime, cached_hash = _hash_cache
+        if cached_hash is not None and cached_mtime == mtime:
+            return cached_hash
         try:
-            with open(ADMIN_PASSWORD_FILE, 'r', encoding='utf-8') as f:
+            with open(ADMIN_PASSWORD_FILE, 'rb') as f:
                 stored_hash = f.read().strip()
                 if stored_hash:
+                    _hash_cache = (mtime, stored_hash)
                     return stored_hash
         except Exception:
             pass
     
     # Если ничего не найдено, создаем дефолтный пароль "admin" и сохраняем его
-    default_hash = bcrypt.hashpw("admin".encode(), bcrypt.gensalt()).decode()
+    default_hash = bcrypt.hashpw(b"admin", bcrypt.gensalt(rounds=get_bcrypt_cost()))
     try:
-        with open(ADMIN_PASSWORD_FILE, 'w', encoding='utf-8') as f:
+        with open(ADMIN_PASSWORD_FILE, 'wb') as f:
             f.write(default_hash)
     except Exception:
         pass
+    _clear_admin_password_cache()
     
     return default_hash
 
+def _clear_admin_password_cache():
+    """Сброс кэша хеша пароля администратора"""
+    global _hash_cache
+    _hash_cache = (0, None)
+
 def set_admin_password_hash(new_password: str) -> bool:
     """Установка нового хеша пароля администратора"""
     try:
-        new_hash = bcrypt.hashpw(new_password.encode(), bcrypt.gensalt()).decode()
-        with open(ADMIN_PASSWORD_FILE, 'w', encoding='utf-8') as f:
+        new_hash = bcrypt.hashpw(new_password.encode(), bcrypt.gensalt(rounds=get_bcrypt_cost()))
+        with open(ADMIN_PASSWORD_FILE, 'wb') as f:
             f.write(new_hash)
+        _clear_admin_password_cache()
         return True
     except Exception:
         return False
@@ -2,236 +2,563 @@
 Работа с SQLite базой данных панели
 """
 import sqlite3
+import asyncio
+import atexit
 import json
+import logging
+import os
+import queue
+import re
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from functools import lru_cache
 from pathlib import Path
-from typing import List, Dict, Optional
-from backend.config import PANEL_DB_PATH
+from typing import List, Dict, NamedTuple, Optional, Tuple
+from backend.config import PANEL_DB_PATH, BOTS_DIR
 
-def get_db_connection():
-    """Получение соединения с БД"""
-    # Убеждаемся, что директория существует
-    PANEL_DB_PATH.parent.mkdir(parents=True, exist_ok=True)
-    
-    conn = sqlite3.connect(PANEL_DB_PATH)
+try:
+    import orjson
+except ImportError:
+    # orjson не установлен - используем стандартный json
+    orjson = None
+
+try:
+    import aiosqlite
+except ImportError:
+    # aiosqlite не установлен - асинхронные функции выполняют синхронные в потоке
+    aiosqlite = None
+
+logger = logging.getLogger(__name__)
+
+# БД в памяти: все соединения процесса работают с одной общей БД (shared cache),
+# без файла, директории и WAL. В shared cache действуют табличные блокировки, которые
+# busy_timeout не ожидает, поэтому чтение в этом режиме идет через соединение записи
+_IN_MEMORY = str(PANEL_DB_PATH) == ":memory:"
+if _IN_MEMORY:
+    _DB_DATABASE, _DB_URI = "file:panel?mode=memory&cache=shared", True
+    _DB_READ_DATABASE = _DB_DATABASE
+else:
+    _DB_DATABASE, _DB_URI = PANEL_DB_PATH, False
+    # Соединения пула чтения открываются только на чтение (mode=ro)
+    _DB_READ_DATABASE = PANEL_DB_PATH.resolve().as_uri() + "?mode=ro"
+
+# PRAGMA, которые действуют только в рамках соединения и задаются для каждого нового соединения
+# (journal_mode=WAL сохраняется в файле БД и устанавливается один раз в init_database)
+_CONNECTION_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-65536",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA journal_size_limit=6144000",
+    "PRAGMA busy_timeout=5000",
+)
+
+# Пул соединений для чтения (в WAL читатели работают параллельно и не блокируют писателя)
+# и одно выделенное соединение для записи (SQLite допускает только одного писателя)
+_READ_POOL_SIZE = 8
+# Размер кэша подготовленных запросов на соединение (по умолчанию в sqlite3 - 128)
+_CACHED_STATEMENTS = 512
+_read_pool = queue.LifoQueue(maxsize=_READ_POOL_SIZE)
+_write_conn = None
+_WRITE_LOCK = threading.RLock()
+
+# Директории, уже созданные в этом процессе (повторный mkdir не нужен)
+_READY_DIRS = set()
+_DIRS_LOCK = threading.Lock()
+
+def _ensure_dir(path: Path):
+    """Создание директории (один раз за процесс)"""
+    if path in _READY_DIRS:
+        return
+    with _DIRS_LOCK:
+        path.mkdir(parents=True, exist_ok=True)
+        _READY_DIRS.add(path)
+
+def _open_connection(read_only: bool = False) -> sqlite3.Connection:
+    """Открытие нового соединения с БД с настроенными PRAGMA"""
+    if read_only:
+        conn = sqlite3.connect(_DB_READ_DATABASE, uri=True, check_same_thread=False, isolation_level=None,
+                               cached_statements=_CACHED_STATEMENTS)
+    else:
+        conn = sqlite3.connect(_DB_DATABASE, uri=_DB_URI, check_same_thread=False, isolation_level=None,
+                               cached_statements=_CACHED_STATEMENTS)
     conn.row_factory = sqlite3.Row
+    for pragma in _CONNECTION_PRAGMAS:
+        conn.execute(pragma)
     return conn
 
-def init_database():
-    """Инициализация базы данных"""
+@contextmanager
+def get_db_connection():
+    """Получение соединения с БД для чтения из пула"""
+    if _IN_MEMORY:
+        # Чтение ждет завершения транзакции записи на _WRITE_LOCK, а не падает на табличной блокировке
+        with get_write_connection() as conn:
+            yield conn
+        return
+    if not _INITIALIZED:
+        init_database()
     try:
-        # Убеждаемся, что директория для БД существует
-        PANEL_DB_PATH.parent.mkdir(parents=True, exist_ok=True)
-        
-        conn = get_db_connection()
+        conn = _read_pool.get_nowait()
+    except queue.Empty:
+        conn = _open_connection(read_only=True)
+    try:
+        yield conn
+    finally:
+        try:
+            _read_pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+@contextmanager
+def get_write_connection():
+    """Получение выделенного соединения с БД для записи"""
+    global _write_conn
+    if not _INITIALIZED:
+        init_database()
+    with _WRITE_LOCK:
+        if _write_conn is None:
+            _write_conn = _open_connection()
+        yield _write_conn
+
+@contextmanager
+def write_transaction():
+    """Транзакция записи на выделенном соединении: BEGIN IMMEDIATE ... COMMIT, ROLLBACK при ошибке"""
+    with get_write_connection() as conn:
         cursor = conn.cursor()
-        
-        # Таблица ботов
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS bots (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                bot_type TEXT NOT NULL,
-                status TEXT NOT NULL DEFAULT 'stopped',
-                start_file TEXT,
-                bot_dir TEXT NOT NULL,
-                pid INTEGER,
-                cpu_limit REAL DEFAULT 50.0,
-                memory_limit INTEGER DEFAULT 512,
-                git_repo_url TEXT,
-                git_branch TEXT DEFAULT 'main',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # Таблица настроек панели
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS panel_settings (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                setting_key TEXT NOT NULL UNIQUE,
-                setting_value TEXT,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # Таблица метрик ботов для графиков
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS bot_metrics (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                bot_id INTEGER NOT NULL,
-                cpu_percent REAL,
-                memory_mb REAL,
-                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (bot_id) REFERENCES bots(id) ON DELETE CASCADE
-            )
-        """)
-        
-        # Создаем индекс для быстрого поиска метрик по боту и времени
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_bot_metrics_bot_time 
-            ON bot_metrics(bot_id, timestamp DESC)
-        """)
-        
-        # Инициализация настроек панели (если нужно добавить новые настройки)
-        
-        # Миграция: добавляем поле auto_start, если его нет
+        cursor.execute("BEGIN IMMEDIATE")
         try:
-            cursor.execute("ALTER TABLE bots ADD COLUMN auto_start INTEGER DEFAULT 0")
-        except sqlite3.OperationalError:
-            # Поле уже существует, игнорируем ошибку
-            pass
-        
-        # Миграция: добавляем поля для отслеживания времени работы
+            yield cursor
+            cursor.execute("COMMIT")
+        except BaseException:
+            # После некоторых ошибок (SQLITE_FULL, IOERR, BUSY на COMMIT) SQLite уже откатил транзакцию сам,
+            # и ROLLBACK без активной транзакции скрыл бы исходное исключение
+            if conn.in_transaction:
+                cursor.execute("ROLLBACK")
+            raise
+
+def optimize_database():
+    """Обновление статистики планировщика запросов (PRAGMA optimize)"""
+    with get_write_connection() as conn:
+        conn.execute("PRAGMA optimize")
+
+def backup_database(target_path: Path):
+    """Снимок БД панели в файл через backup API (в том числе для БД в памяти)"""
+    with get_db_connection() as conn:
+        target = sqlite3.connect(target_path)
         try:
-            cursor.execute("ALTER TABLE bots ADD COLUMN started_at TIMESTAMP")
-        except sqlite3.OperationalError:
-            pass
-        
+            conn.backup(target)
+        finally:
+            target.close()
+
+def close_database():
+    """Закрытие всех соединений пула (при остановке панели)"""
+    global _write_conn, _INITIALIZED, _settings_cache
+    while True:
         try:
-            cursor.execute("ALTER TABLE bots ADD COLUMN last_started_at TIMESTAMP")
-        except sqlite3.OperationalError:
-            pass
-        
+            _read_pool.get_nowait().close()
+        except queue.Empty:
+            break
+    with _WRITE_LOCK:
+        if _write_conn is not None:
+            # Перед закрытием обновляем статистику планировщика (рекомендация SQLite)
+            try:
+                _write_conn.execute("PRAGMA optimize")
+            except sqlite3.Error:
+                pass
+            _write_conn.close()
+            _write_conn = None
+    
+    if _IN_MEMORY:
+        # С последним соединением БД в памяти удаляется - при следующем запуске схему нужно создать заново
+        _INITIALIZED = False
+        _invalidate_bot_cache()
+        _settings_cache = None
+
+# Соединения пула закрываются и при выходе без события shutdown (скрипты, start_panel.py)
+atexit.register(close_database)
+
+# Общее асинхронное соединение для чтения из обработчиков запросов (открывается при старте панели)
+_ADB = None
+
+async def init_async_database():
+    """Открытие общего асинхронного соединения с БД"""
+    global _ADB
+    # В памяти отдельное соединение попало бы под табличные блокировки shared cache:
+    # асинхронные функции выполняют синхронные в потоке
+    if aiosqlite is None or _ADB is not None or _IN_MEMORY:
+        return
+    
+    if not _INITIALIZED:
+        init_database()
+    _ADB = await aiosqlite.connect(_DB_DATABASE, uri=_DB_URI, isolation_level=None,
+                                   cached_statements=_CACHED_STATEMENTS)
+    _ADB.row_factory = BotRow
+    for pragma in _CONNECTION_PRAGMAS:
+        await _ADB.execute(pragma)
+
+async def close_async_database():
+    """Закрытие общего асинхронного соединения с БД"""
+    global _ADB
+    if _ADB is not None:
+        adb, _ADB = _ADB, None
+        await adb.close()
+
+# Флаг однократной инициализации схемы БД в рамках процесса. Инициализация выполняется
+# явно при старте панели или лениво при первом обращении к БД
+_INITIALIZED = False
+_initializing = False
+_INIT_LOCK = threading.RLock()
+
+def init_database():
+    """Инициализация базы данных"""
+    global _INITIALIZED, _initializing
+    if _INITIALIZED:
+        return
+    
+    with _INIT_LOCK:
+        # Повторный вход из самой инициализации (через get_write_connection) - пропускаем
+        if _INITIALIZED or _initializing:
+            return
+        _initializing = True
         try:
-            cursor.execute("ALTER TABLE bots ADD COLUMN last_stopped_at TIMESTAMP")
-        except sqlite3.OperationalError:
-            pass
+            _init_database()
+            _INITIALIZED = True
+        finally:
+            _initializing = False
+
+def _init_database():
+    """Включение WAL, создание схемы и обновление статистики"""
+    try:
+        # Директория БД создается один раз при инициализации, а не при каждом открытии соединения
+        if not _IN_MEMORY:
+            os.makedirs(PANEL_DB_PATH.parent, exist_ok=True)
         
-        try:
-            cursor.execute("ALTER TABLE bots ADD COLUMN last_crashed_at TIMESTAMP")
-        except sqlite3.OperationalError:
-            pass
+        with get_write_connection() as conn:
+            # WAL: читатели не блокируют писателя, меньше fsync на транзакцию (режим сохраняется в файле БД)
+            if not _IN_MEMORY:
+                conn.execute("PRAGMA journal_mode=WAL")
+        
+        # Вся схема и миграции создаются в одной транзакции (один fsync при первом запуске).
+        # IMMEDIATE сразу берет блокировку записи: несколько процессов панели выполняют
+        # миграции по очереди (ожидание через busy_timeout)
+        with write_transaction() as cursor:
+            _create_schema(cursor)
+        
+        # После миграций обновляем статистику планировщика. 0x10002 - вариант для долгоживущих
+        # соединений: анализируются все таблицы, в том числе еще не использованные этим соединением
+        with get_write_connection() as conn:
+            conn.execute("PRAGMA optimize=0x10002")
         
-        conn.commit()
-        conn.close()
+        # Директории, не удаленные до остановки панели (например, при сбое), удаляем в фоне
+        _sweep_trash_dirs()
     except Exception as e:
         # Логируем ошибку, но не прерываем выполнение
-        import logging
-        logging.error(f"Ошибка инициализации базы данных: {e}")
+        logger.error(f"Ошибка инициализации базы данных: {e}")
         raise
 
+# Столбцы bots, добавляемые миграцией в существующие БД: (имя, тип и значение по умолчанию)
+_BOT_MIGRATION_COLUMNS = (
+    ('auto_start', 'INTEGER DEFAULT 0'),
+    # Время работы бота
+    ('started_at', 'TIMESTAMP'),
+    ('last_started_at', 'TIMESTAMP'),
+    ('last_stopped_at', 'TIMESTAMP'),
+    ('last_crashed_at', 'TIMESTAMP'),
+    # Хеш requirements.txt последней успешной установки зависимостей
+    ('requirements_hash', 'TEXT'),
+)
+
+def _create_schema(cursor: sqlite3.Cursor):
+    """Создание таблиц, индексов и миграции схемы"""
+    # Таблица ботов
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS bots (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            bot_type TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'stopped',
+            start_file TEXT,
+            bot_dir TEXT NOT NULL,
+            pid INTEGER,
+            cpu_limit REAL DEFAULT 50.0,
+            memory_limit INTEGER DEFAULT 512,
+            git_repo_url TEXT,
+            git_branch TEXT DEFAULT 'main',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    
+    # Таблица настроек панели
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS panel_settings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            setting_key TEXT NOT NULL UNIQUE,
+            setting_value TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    
+    # Таблица метрик ботов для графиков
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS bot_metrics (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            bot_id INTEGER NOT NULL,
+            cpu_percent REAL,
+            memory_mb REAL,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (bot_id) REFERENCES bots(id) ON DELETE CASCADE
+        )
+    """)
+    
+    # Создаем индекс для быстрого поиска метрик по боту и времени
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_bot_metrics_bot_time 
+        ON bot_metrics(bot_id, timestamp DESC)
+    """)
+    
+    # Индекс для выборок ботов по статусу (мониторинг, автозапуск)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_bots_status ON bots(status)")
+    
+    # updated_at обновляется триггером, UPDATE в update_bot его не содержит
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_bots_updated_at
+        AFTER UPDATE ON bots
+        FOR EACH ROW WHEN NEW.updated_at = OLD.updated_at
+        BEGIN
+            UPDATE bots SET updated_at = CURRENT_TIMESTAMP WHERE id = OLD.id;
+        END
+    """)
+    
+    # Инициализация настроек панели (если нужно добавить новые настройки)
+    
+    # Миграции: столбцы, добавленные после первой версии схемы. Наличие проверяется
+    # по PRAGMA table_info, без ALTER TABLE с ожидаемой ошибкой при каждом запуске
+    existing_columns = {row[1] for row in cursor.execute("PRAGMA table_info(bots)")}
+    for column, column_type in _BOT_MIGRATION_COLUMNS:
+        if column not in existing_columns:
+            cursor.execute(f"ALTER TABLE bots ADD COLUMN {column} {column_type}")
+
+# Кэш настроек панели: таблица читается целиком при первом обращении,
+# дальше изменения вносятся в set_panel_setting после записи в БД
+_settings_cache = None
+_SETTINGS_LOCK = threading.Lock()
+
+def _load_panel_settings() -> Dict[str, Optional[str]]:
+    """Загрузка всех настроек панели в кэш (один раз)"""
+    global _settings_cache
+    with _SETTINGS_LOCK:
+        if _settings_cache is None:
+            with get_db_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT setting_key, setting_value FROM panel_settings")
+                _settings_cache = {row[0]: row[1] for row in cursor}
+        return _settings_cache
+
 def get_panel_setting(key: str, default: str = None) -> Optional[str]:
     """Получение настройки панели"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT setting_value FROM panel_settings WHERE setting_key = ?", (key,))
-        row = cursor.fetchone()
-        conn.close()
+        settings = _settings_cache
+        if settings is None:
+            settings = _load_panel_settings()
         
-        if row:
-            return row[0] if row[0] is not None else default
-        return default
+        value = settings.get(key)
+        return value if value is not None else default
     except Exception as e:
-        import logging
-        logging.error(f"Ошибка получения настройки {key}: {e}")
+        logger.error(f"Ошибка получения настройки {key}: {e}")
         return default
 
 def set_panel_setting(key: str, value: str) -> bool:
     """Сохранение настройки панели"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            INSERT INTO panel_settings (setting_key, setting_value, updated_at)
-            VALUES (?, ?, CURRENT_TIMESTAMP)
-            ON CONFLICT(setting_key) DO UPDATE SET
-                setting_value = excluded.setting_value,
-                updated_at = CURRENT_TIMESTAMP
-        """, (key, value))
-        conn.commit()
-        conn.close()
+        with get_write_connection() as conn:
+            conn.execute("""
+                INSERT INTO panel_settings (setting_key, setting_value, updated_at)
+                VALUES (?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT(setting_key) DO UPDATE SET
+                    setting_value = excluded.setting_value,
+                    updated_at = CURRENT_TIMESTAMP
+            """, (key, value))
+            # Обновляем кэш под блокировкой записи, чтобы порядок изменений совпадал с БД
+            with _SETTINGS_LOCK:
+                if _settings_cache is not None:
+                    _settings_cache[key] = value
         return True
     except Exception as e:
-        import logging
-        logging.error(f"Ошибка сохранения настройки {key}: {e}")
+        logger.error(f"Ошибка сохранения настройки {key}: {e}")
         return False
 
+def read_bot_config(config_path: Path) -> Dict:
+    """Чтение config.json бота"""
+    if orjson is not None:
+        return orjson.loads(config_path.read_bytes())
+    with open(config_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def write_bot_config(config_path: Path, config: Dict):
+    """Запись config.json бота
+    
+    Файл записывается во временный и атомарно заменяет config.json (os.replace),
+    поэтому при сбое во время записи остается прежняя версия, а не обрезанный файл.
+    """
+    if orjson is not None:
+        data = orjson.dumps(config, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    else:
+        data = json.dumps(config, ensure_ascii=False, indent=2).encode('utf-8')
+    
+    # Имя временного файла уникально для потока, параллельные записи не пересекаются
+    tmp_path = config_path.with_name(f"{config_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, config_path)
+    except Exception:
+        try:
+            tmp_path.unlink()
+        except OSError:
+            pass
+        raise
+
+# Таблица замены ASCII-символов, недопустимых в именах файлов и директорий (кроме букв, цифр, _ и -)
+_SAFE_NAME_TABLE = str.maketrans({c: '_' for c in map(chr, range(128)) if not (c.isalnum() or c in '_-')})
+# То же для остальных символов Unicode (\w учитывает Unicode, как str.isalnum)
+_SAFE_NAME_RE = re.compile(r'[^\w-]')
+
+def sanitize_name(name: str) -> str:
+    """Замена символов, кроме букв, цифр, _ и -, на _"""
+    safe_name = name.translate(_SAFE_NAME_TABLE)
+    if not safe_name.isascii():
+        # Буквы других алфавитов сохраняются, прочие символы заменяет регулярное выражение
+        safe_name = _SAFE_NAME_RE.sub('_', safe_name)
+    return safe_name
+
+def _prepare_bot_dir(name: str, bot_type: str, start_file: str, cpu_limit: float, memory_limit: int,
+                     git_repo_url: Optional[str], git_branch: str) -> Path:
+    """Создание директории бота, config.json и шаблонов (без обращения к БД)"""
+    # Создаем директорию для бота
+    # Очищаем имя от недопустимых символов
+    safe_name = sanitize_name(name.lower()) or "bot"
+    _ensure_dir(BOTS_DIR)
+    bot_dir = BOTS_DIR / f"bot_{safe_name}"
+    try:
+        bot_dir.mkdir()
+        new_dir = True
+    except FileExistsError:
+        new_dir = False
+    
+    # Сохраняем конфиг бота
+    config_path = bot_dir / "config.json"
+    config = {
+        "name": name,
+        "bot_type": bot_type,
+        "start_file": start_file,
+        "cpu_limit": cpu_limit,
+        "memory_limit": memory_limit,
+        "git_repo_url": git_repo_url,
+        "git_branch": git_branch
+    }
+    write_bot_config(config_path, config)
+    
+    # Создаем шаблонные файлы, если их нет и не указан Git репозиторий
+    # (если указан репозиторий, файлы будут из него)
+    # (в только что созданной директории файлов заведомо нет - без лишней проверки exists())
+    if not git_repo_url and (new_dir or not start_file or not (bot_dir / start_file).exists()):
+        try:
+            create_bot_templates(bot_dir, bot_type, start_file)
+        except Exception as template_error:
+            logger.warning(f"Failed to create bot templates: {template_error}")
+            # Не критично, продолжаем создание бота
+    
+    return bot_dir
+
+# Общий текст INSERT для create_bot и create_bots_bulk (один подготовленный запрос в кэше соединения)
+# status ('stopped') и auto_start (0) берутся из значений по умолчанию схемы
+_INSERT_BOT_SQL = """
+    INSERT INTO bots (name, bot_type, start_file, bot_dir, cpu_limit, memory_limit, git_repo_url, git_branch)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
 def create_bot(name: str, bot_type: str, start_file: str = None, 
                cpu_limit: float = 50.0, memory_limit: int = 512,
                git_repo_url: str = None, git_branch: str = "main") -> int:
+    """Создание нового бота"""
     # Устанавливаем main.py по умолчанию, если start_file не указан
     if not start_file:
         start_file = 'main.py'
-    """Создание нового бота"""
-    from backend.config import BOTS_DIR
-    import os
-    import logging
-    
-    logger = logging.getLogger(__name__)
     
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Создаем директорию для бота
-        # Очищаем имя от недопустимых символов
-        safe_name = "".join(c if c.isalnum() or c in ('_', '-') else '_' for c in name.lower().replace(' ', '_'))
-        if not safe_name:
-            safe_name = "bot"
-        bot_dir = BOTS_DIR / f"bot_{safe_name}"
-        bot_dir.mkdir(parents=True, exist_ok=True)
+        # Работа с файловой системой выполняется до захвата соединения на запись,
+        # чтобы транзакция содержала только INSERT
+        bot_dir = _prepare_bot_dir(name, bot_type, start_file, cpu_limit, memory_limit, git_repo_url, git_branch)
         
-        # Сохраняем конфиг бота
-        config_path = bot_dir / "config.json"
-        config = {
-            "name": name,
-            "bot_type": bot_type,
-            "start_file": start_file,
-            "cpu_limit": cpu_limit,
-            "memory_limit": memory_limit,
-            "git_repo_url": git_repo_url,
-            "git_branch": git_branch
-        }
-        with open(config_path, 'w', encoding='utf-8') as f:
-            json.dump(config, f, ensure_ascii=False, indent=2)
-        
-        # Создаем шаблонные файлы, если их нет и не указан Git репозиторий
-        # (если указан репозиторий, файлы будут из него)
-        if not git_repo_url and (not start_file or not (bot_dir / start_file).exists()):
-            try:
-                create_bot_templates(bot_dir, bot_type, start_file)
-            except Exception as template_error:
-                logger.warning(f"Failed to create bot templates: {template_error}")
-                # Не критично, продолжаем создание бота
-        
-        cursor.execute("""
-            INSERT INTO bots (name, bot_type, start_file, bot_dir, cpu_limit, memory_limit, git_repo_url, git_branch, status, auto_start)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'stopped', 0)
-        """, (name, bot_type, start_file, str(bot_dir), cpu_limit, memory_limit, git_repo_url, git_branch))
-        
-        bot_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        with write_transaction() as cursor:
+            cursor.execute(_INSERT_BOT_SQL, (name, bot_type, start_file, str(bot_dir), cpu_limit, memory_limit, git_repo_url, git_branch))
+            bot_id = cursor.lastrowid
+        _invalidate_bot_cache()
         
         logger.info(f"Bot created successfully: {name} (ID: {bot_id})")
         return bot_id
     except sqlite3.IntegrityError as e:
         logger.error(f"Database integrity error creating bot: {e}")
-        if 'conn' in locals():
-            try:
-                conn.rollback()
-                conn.close()
-            except:
-                pass
         raise ValueError(f"Бот с таким именем уже существует: {name}")
     except Exception as e:
         logger.error(f"Error in create_bot: {e}", exc_info=True)
-        if 'conn' in locals():
-            try:
-                conn.rollback()
-                conn.close()
-            except:
-                pass
         raise
 
+def create_bots_bulk(specs: List[Dict]) -> List[int]:
+    """Пакетное создание ботов одной транзакцией
+    
+    Каждый элемент specs содержит аргументы create_bot (name, bot_type и необязательные поля).
+    Возвращает ID созданных ботов в порядке specs.
+    """
+    if not specs:
+        return []
+    
+    rows = []
+    for spec in specs:
+        rows.append((
+            spec['name'],
+            spec['bot_type'],
+            spec.get('start_file') or 'main.py',
+            spec.get('cpu_limit', 50.0),
+            spec.get('memory_limit', 512),
+            spec.get('git_repo_url'),
+            spec.get('git_branch', 'main'),
+        ))
+    
+    # Подготовка директорий - операции ввода-вывода, выполняем их параллельно
+    with ThreadPoolExecutor(max_workers=min(8, len(rows))) as executor:
+        bot_dirs = list(executor.map(lambda row: _prepare_bot_dir(*row), rows))
+    
+    params = [
+        (name, bot_type, start_file, str(bot_dir), cpu_limit, memory_limit, git_repo_url, git_branch)
+        for (name, bot_type, start_file, cpu_limit, memory_limit, git_repo_url, git_branch), bot_dir
+        in zip(rows, bot_dirs)
+    ]
+    
+    try:
+        with write_transaction() as cursor:
+            cursor.executemany(_INSERT_BOT_SQL, params)
+            # Под блокировкой записи ID выдаются подряд, последний - last_insert_rowid()
+            last_id = cursor.execute("SELECT last_insert_rowid()").fetchone()[0]
+    except sqlite3.IntegrityError as e:
+        logger.error(f"Database integrity error creating bots: {e}")
+        raise ValueError(f"Ошибка целостности данных при создании ботов: {e}")
+    _invalidate_bot_cache()
+    
+    bot_ids = list(range(last_id - len(params) + 1, last_id + 1))
+    logger.info(f"Bots created successfully: {len(bot_ids)}")
+    return bot_ids
+
 def calculate_uptime(started_at: Optional[str]) -> Optional[str]:
     """Расчет времени работы бота в читаемом формате"""
     if not started_at:
         return None
     
     try:
-        from datetime import datetime
         start_time = datetime.fromisoformat(started_at)
         now = datetime.now()
         delta = now - start_time
@@ -251,108 +578,295 @@ def calculate_uptime(started_at: Optional[str]) -> Optional[str]:
     except Exception:
         return None
 
-def get_bot(bot_id: int) -> Optional[Dict]:
+# Столбцы таблицы bots в явном порядке (вместо SELECT *)
+_BOT_COLUMNS = (
+    'id', 'name', 'bot_type', 'status', 'start_file', 'bot_dir', 'pid', 'cpu_limit', 'memory_limit',
+    'git_repo_url', 'git_branch', 'created_at', 'updated_at', 'auto_start', 'started_at',
+    'last_started_at', 'last_stopped_at', 'last_crashed_at', 'requirements_hash',
+)
+# Для списка ботов служебный requirements_hash не нужен
+_BOT_LIST_COLUMNS = tuple(column for column in _BOT_COLUMNS if column != 'requirements_hash')
+
+_SELECT_BOT_SQL = f"SELECT {', '.join(_BOT_COLUMNS)} FROM bots WHERE id = ?"
+# id (AUTOINCREMENT) растет вместе с created_at: порядок тот же, без сортировки
+_SELECT_BOTS_SQL = f"SELECT {', '.join(_BOT_LIST_COLUMNS)} FROM bots ORDER BY id DESC"
+
+class BotRow(sqlite3.Row):
+    """Строка бота: доступ по имени столбца без копирования в dict (как у sqlite3.Row) и метод get"""
+    
+    def get(self, key: str, default=None):
+        try:
+            return self[key]
+        except IndexError:
+            return default
+
+# Кэш чтения ботов: bot_id -> (BotRow, истекает), ключ None - полный список словарей.
+# Список ботов опрашивается интерфейсом гораздо чаще, чем меняется. Любая запись в таблицу bots
+# увеличивает версию и очищает кэш; TTL ограничивает устаревание при записи из другого процесса
+_BOT_CACHE_TTL = 1.0
+_bot_cache = {}
+_bot_cache_version = 0
+_BOT_CACHE_LOCK = threading.Lock()
+
+def _invalidate_bot_cache():
+    """Сброс кэша ботов (вызывается после фиксации записи в таблицу bots)"""
+    global _bot_cache_version
+    with _BOT_CACHE_LOCK:
+        _bot_cache_version += 1
+        _bot_cache.clear()
+
+def _bot_cache_get(key):
+    """Значение из кэша ботов или None, если его нет или TTL истек"""
+    entry = _bot_cache.get(key)
+    if entry is not None and entry[1] > time.monotonic():
+        return entry[0]
+    return None
+
+def _bot_cache_put(key, value, version: int):
+    """Сохранение в кэш, если с момента чтения (version) не было записи"""
+    with _BOT_CACHE_LOCK:
+        if version == _bot_cache_version:
+            _bot_cache[key] = (value, time.monotonic() + _BOT_CACHE_TTL)
+
+def get_bot(bot_id: int) -> Optional[BotRow]:
     """Получение информации о боте"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    row = _bot_cache_get(bot_id)
+    if row is not None:
+        return row
     
-    cursor.execute("SELECT * FROM bots WHERE id = ?", (bot_id,))
-    row = cursor.fetchone()
-    conn.close()
+    version = _bot_cache_version
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        # Возвращаем строку без преобразования в dict: вызывающему коду обычно нужны 1-3 столбца
+        cursor.row_factory = BotRow
+        cursor.execute(_SELECT_BOT_SQL, (bot_id,))
+        row = cursor.fetchone()
     
-    if row:
-        return dict(row)
-    return None
+    if row is not None:
+        _bot_cache_put(bot_id, row, version)
+    return row
 
 def get_all_bots() -> List[Dict]:
     """Получение списка всех ботов"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    cached = _bot_cache_get(None)
+    if cached is None:
+        version = _bot_cache_version
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            # Читаем сырые кортежи без обертки sqlite3.Row
+            cursor.row_factory = None
+            cursor.execute(_SELECT_BOTS_SQL)
+            cached = [dict(zip(_BOT_LIST_COLUMNS, row)) for row in cursor]
+        _bot_cache_put(None, cached, version)
+    
+    # Вызывающий код изменяет словари (статус, uptime): отдаем поверхностные копии,
+    # dict.copy() на порядок дешевле повторной сборки dict(zip(...))
+    return [bot.copy() for bot in cached]
+
+class RunningBot(NamedTuple):
+    """Запущенный бот: только нужные мониторингу столбцы"""
+    id: int
+    name: str
+    pid: int
+
+def get_running_bots() -> List[RunningBot]:
+    """Боты со статусом running (id, name, pid)"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        # Сырые кортежи без sqlite3.Row; RunningBot строится из них без dict
+        cursor.row_factory = None
+        # Выборка по индексу idx_bots_status без чтения остальных столбцов
+        cursor.execute("SELECT id, name, pid FROM bots WHERE status = 'running' AND pid IS NOT NULL")
+        return [RunningBot._make(row) for row in cursor]
+
+async def aget_bot(bot_id: int) -> Optional[BotRow]:
+    """Получение информации о боте без блокировки event loop"""
+    if _ADB is None:
+        return await asyncio.to_thread(get_bot, bot_id)
     
-    cursor.execute("SELECT * FROM bots ORDER BY created_at DESC")
-    rows = cursor.fetchall()
-    conn.close()
+    row = _bot_cache_get(bot_id)
+    if row is not None:
+        return row
     
-    return [dict(row) for row in rows]
+    version = _bot_cache_version
+    rows = await _ADB.execute_fetchall(_SELECT_BOT_SQL, (bot_id,))
+    if rows:
+        _bot_cache_put(bot_id, rows[0], version)
+        return rows[0]
+    return None
+
+async def aget_all_bots() -> List[Dict]:
+    """Получение списка всех ботов без блокировки event loop"""
+    if _ADB is None:
+        return await asyncio.to_thread(get_all_bots)
+    
+    cached = _bot_cache_get(None)
+    if cached is None:
+        version = _bot_cache_version
+        cursor = await _ADB.execute(_SELECT_BOTS_SQL)
+        cached = [dict(row) for row in await cursor.fetchall()]
+        await cursor.close()
+        _bot_cache_put(None, cached, version)
+    
+    return [bot.copy() for bot in cached]
+
+# UPDATE ... RETURNING (SQLite 3.35+) возвращает bot_dir тем же запросом, без отдельного SELECT
+_HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+# Поля бота, которые можно изменить через update_bot
+_UPDATE_FIELDS = frozenset({
+    'name', 'bot_type', 'start_file', 'cpu_limit', 'memory_limit',
+    'status', 'pid', 'git_repo_url', 'git_branch', 'auto_start',
+    'started_at', 'last_started_at', 'last_stopped_at', 'last_crashed_at',
+    'requirements_hash',
+})
+
+# Поля бота, которые дублируются в config.json
+_CONFIG_FIELDS = frozenset({'name', 'bot_type', 'start_file', 'cpu_limit', 'memory_limit', 'git_repo_url', 'git_branch'})
+
+# config.json обновляется в фоне; один поток сохраняет порядок обновлений
+_config_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="bot-config")
+
+def _sync_bot_config(bot_dir: str, updates: Dict):
+    """Обновление config.json бота после изменения записи в БД"""
+    config_path = Path(bot_dir) / "config.json"
+    try:
+        if config_path.exists():
+            config = read_bot_config(config_path)
+            for field in _CONFIG_FIELDS:
+                if field in updates:
+                    config[field] = updates[field]
+            write_bot_config(config_path, config)
+    except Exception as e:
+        logger.error(f"Ошибка обновления {config_path}: {e}")
+
+@lru_cache(maxsize=128)
+def _build_update_sql(columns: tuple, returning: bool = False) -> str:
+    """Построение UPDATE для набора столбцов (кэшируется по набору)"""
+    # Одна строка SQL на набор столбцов, а не общий SET col = COALESCE(?, col) по всем полям:
+    # COALESCE не позволяет записать NULL, а pid и started_at сбрасываются именно в NULL.
+    # Наборов полей на практике немного, их запросы остаются в кэше соединения (_CACHED_STATEMENTS)
+    # updated_at выставляет триггер trg_bots_updated_at
+    set_clause = ", ".join([f"{k} = ?" for k in columns])
+    if returning:
+        return f"UPDATE bots SET {set_clause} WHERE id = ? RETURNING bot_dir"
+    return f"UPDATE bots SET {set_clause} WHERE id = ?"
 
 def update_bot(bot_id: int, **kwargs) -> bool:
     """Обновление информации о боте"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
     # Фильтруем только допустимые поля
-    allowed_fields = ['name', 'bot_type', 'start_file', 'cpu_limit', 'memory_limit', 
-                     'status', 'pid', 'git_repo_url', 'git_branch', 'auto_start',
-                     'started_at', 'last_started_at', 'last_stopped_at', 'last_crashed_at']
-    updates = {k: v for k, v in kwargs.items() if k in allowed_fields}
+    updates = {k: v for k, v in kwargs.items() if k in _UPDATE_FIELDS}
     
     # Преобразуем auto_start из bool в int для SQLite
     if 'auto_start' in updates and isinstance(updates['auto_start'], bool):
         updates['auto_start'] = 1 if updates['auto_start'] else 0
     
     if not updates:
-        conn.close()
         return False
     
-    # Обновляем конфиг файл если изменились настройки
-    bot = get_bot(bot_id)
-    if bot:
-        config_path = Path(bot['bot_dir']) / "config.json"
-        if config_path.exists():
-            with open(config_path, 'r', encoding='utf-8') as f:
-                config = json.load(f)
-            
-            config_updates = ['name', 'bot_type', 'start_file', 'cpu_limit', 'memory_limit', 'git_repo_url', 'git_branch']
-            for field in config_updates:
-                if field in updates:
-                    config[field] = updates[field]
-            
-            with open(config_path, 'w', encoding='utf-8') as f:
-                json.dump(config, f, ensure_ascii=False, indent=2)
+    # Столбцы в стабильном порядке: одинаковый набор полей дает одинаковую строку SQL,
+    # и sqlite3 переиспользует подготовленный запрос из кэша
+    columns = tuple(sorted(updates))
+    values = [updates[k] for k in columns] + [bot_id]
+    
+    # status, pid и время запуска в config.json не хранятся: без полей конфига
+    # (самый частый случай) файл не трогаем и bot_dir не запрашиваем
+    if _CONFIG_FIELDS.isdisjoint(updates):
+        with get_write_connection() as conn:
+            updated = conn.execute(_build_update_sql(columns), values).rowcount > 0
+        _invalidate_bot_cache()
+        return updated
+    
+    update_sql = _build_update_sql(columns, _HAS_RETURNING)
+    if _HAS_RETURNING:
+        with get_write_connection() as conn:
+            # Один запрос в autocommit: UPDATE сразу возвращает bot_dir
+            rows = conn.execute(update_sql, values).fetchall()
+            row = rows[0] if rows else None
+    else:
+        with write_transaction() as cursor:
+            cursor.execute("SELECT bot_dir FROM bots WHERE id = ?", (bot_id,))
+            row = cursor.fetchone()
+            if row:
+                cursor.execute(update_sql, values)
+    _invalidate_bot_cache()
+    
+    if not row:
+        return False
     
-    set_clause = ", ".join([f"{k} = ?" for k in updates.keys()])
-    set_clause += ", updated_at = CURRENT_TIMESTAMP"
-    values = list(updates.values()) + [bot_id]
+    # Обновляем конфиг файл в фоне, не задерживая запись в БД и ответ
+    _config_writer.submit(_sync_bot_config, row[0], updates)
+    return True
+
+def update_bots_status_bulk(rows: List[Tuple[str, Optional[int], int]]) -> int:
+    """Пакетное обновление status и pid ботов одной транзакцией
     
-    cursor.execute(f"UPDATE bots SET {set_clause} WHERE id = ?", values)
-    conn.commit()
-    conn.close()
+    rows - кортежи (status, pid, bot_id). config.json не затрагивается: status и pid в нем не хранятся.
+    Возвращает количество обновленных ботов.
+    """
+    if not rows:
+        return 0
     
-    return cursor.rowcount > 0
+    with write_transaction() as cursor:
+        # updated_at выставляет триггер trg_bots_updated_at
+        cursor.executemany("UPDATE bots SET status = ?, pid = ? WHERE id = ?", rows)
+        updated = cursor.rowcount
+    _invalidate_bot_cache()
+    return updated
+
+# Префикс переименованных директорий удаленных ботов (удаляются в фоне)
+_TRASH_PREFIX = ".deleted_"
+
+# Поток ThreadPoolExecutor не демон: при выходе интерпретатор дожидается завершения удаления
+_trash_remover = ThreadPoolExecutor(max_workers=1, thread_name_prefix="bot-trash")
+
+def _sweep_trash_dirs():
+    """Удаление директорий ботов, оставшихся от прерванных удалений"""
+    try:
+        trash_dirs = list(BOTS_DIR.glob(f"{_TRASH_PREFIX}*"))
+    except OSError:
+        return
+    for trash_dir in trash_dirs:
+        _trash_remover.submit(shutil.rmtree, trash_dir, ignore_errors=True)
 
 def delete_bot(bot_id: int) -> bool:
     """Удаление бота"""
-    import shutil
-    
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    # Сначала удаляем из БД (источник истины), транзакция не ждет удаления файлов.
+    # DELETE ... RETURNING одним запросом проверяет существование бота и возвращает bot_dir
+    if _HAS_RETURNING:
+        with get_write_connection() as conn:
+            rows = conn.execute("DELETE FROM bots WHERE id = ? RETURNING bot_dir", (bot_id,)).fetchall()
+            row = rows[0] if rows else None
+    else:
+        with write_transaction() as cursor:
+            cursor.execute("SELECT bot_dir FROM bots WHERE id = ?", (bot_id,))
+            row = cursor.fetchone()
+            if row:
+                cursor.execute("DELETE FROM bots WHERE id = ?", (bot_id,))
+    _invalidate_bot_cache()
     
-    # Получаем информацию о боте
-    bot = get_bot(bot_id)
-    if not bot:
-        conn.close()
+    if not row:
         return False
     
-    # Удаляем директорию бота
-    bot_dir = Path(bot['bot_dir'])
+    # Удаляем директорию бота в фоне. Директорию сначала переименовываем,
+    # чтобы новый бот с тем же именем не попал под удаление
+    bot_dir = Path(row[0])
     if bot_dir.exists():
-        shutil.rmtree(bot_dir)
-    
-    # Удаляем из БД
-    cursor.execute("DELETE FROM bots WHERE id = ?", (bot_id,))
-    conn.commit()
-    conn.close()
+        trash_dir = bot_dir.with_name(f"{_TRASH_PREFIX}{bot_dir.name}_{bot_id}")
+        try:
+            bot_dir.rename(trash_dir)
+        except OSError as e:
+            # Без переименования фоновое удаление может задеть директорию нового бота с тем же именем
+            logger.warning(f"Не удалось переименовать {bot_dir} перед удалением ({e}), удаляем сразу")
+            shutil.rmtree(bot_dir, ignore_errors=True)
+        else:
+            _trash_remover.submit(shutil.rmtree, trash_dir, ignore_errors=True)
     
-    return cursor.rowcount > 0
+    return True
 
 
-def create_bot_templates(bot_dir: Path, bot_type: str, start_file: str = 'main.py'):
-    """Создание шаблонных файлов для бота"""
-    if bot_type == 'telegram':
-        # Создаем main.py для Telegram
-        main_file = bot_dir / start_file
-        if not main_file.exists():
-            main_content = '''#!/usr/bin/env python3
+# Шаблон main.py для Telegram бота
+_TELEGRAM_MAIN = '''#!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 """
 Telegram бот - простой шаблон
@@ -420,18 +934,12 @@ def main():
 if __name__ == '__main__':
     main()
 '''
-            main_file.write_text(main_content, encoding='utf-8')
-        
-        # Создаем requirements.txt для Telegram
-        requirements_file = bot_dir / "requirements.txt"
-        if not requirements_file.exists():
-            requirements_content = "python-telegram-bot==20.7\n"
-            requirements_file.write_text(requirements_content, encoding='utf-8')
-        
-        # Создаем README для Telegram бота
-        readme_file = bot_dir / "README.md"
-        if not readme_file.exists():
-            readme_content = '''# Telegram Bot Template
+
+# requirements.txt для Telegram бота
+_TELEGRAM_REQS = "python-telegram-bot==20.7\n"
+
+# README для Telegram бота
+_TELEGRAM_README = '''# Telegram Bot Template
 
 Это простой шаблон Telegram бота, созданный через DSTG Panel.
 
@@ -469,13 +977,9 @@ application.add_handler(CommandHandler("your_command", your_handler))
 application.add_handler(MessageHandler(filters.TEXT, your_message_handler))
 ```
 '''
-            readme_file.write_text(readme_content, encoding='utf-8')
-    
-    elif bot_type == 'discord':
-        # Создаем main.py для Discord
-        main_file = bot_dir / start_file
-        if not main_file.exists():
-            main_content = '''#!/usr/bin/env python3
+
+# Шаблон main.py для Discord бота
+_DISCORD_MAIN = '''#!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 """
 Discord бот - шаблон
@@ -674,18 +1178,12 @@ def main():
 if __name__ == '__main__':
     main()
 '''
-            main_file.write_text(main_content, encoding='utf-8')
-        
-        # Создаем requirements.txt для Discord
-        requirements_file = bot_dir / "requirements.txt"
-        if not requirements_file.exists():
-            requirements_content = "discord.py==2.3.2\n"
-            requirements_file.write_text(requirements_content, encoding='utf-8')
-        
-        # Создаем README для Discord бота
-        readme_file = bot_dir / "README.md"
-        if not readme_file.exists():
-            readme_content = '''# Discord Bot Template
+
+# requirements.txt для Discord бота
+_DISCORD_REQS = "discord.py==2.3.2\n"
+
+# README для Discord бота
+_DISCORD_README = '''# Discord Bot Template
 
 Это шаблон Discord бота, созданный через DSTG Panel.
 
@@ -730,50 +1228,68 @@ if __name__ == '__main__':
 
 Все зависимости указаны в `requirements.txt` и устанавливаются автоматически при первом запуске.
 '''
-            readme_file.write_text(readme_content, encoding='utf-8')
+
+# Шаблоны файлов по типу бота: main.py, requirements.txt, README.md
+# Шаблоны кодируются в UTF-8 один раз при импорте и записываются как есть
+_TEMPLATES = {
+    'telegram': tuple(t.encode('utf-8') for t in (_TELEGRAM_MAIN, _TELEGRAM_REQS, _TELEGRAM_README)),
+    'discord': tuple(t.encode('utf-8') for t in (_DISCORD_MAIN, _DISCORD_REQS, _DISCORD_README)),
+}
+
+def create_bot_templates(bot_dir: Path, bot_type: str, start_file: str = 'main.py'):
+    """Создание шаблонных файлов для бота"""
+    templates = _TEMPLATES.get(bot_type)
+    if not templates:
+        return
+    
+    main_content, requirements_content, readme_content = templates
+    # Пути собираем из строки директории, без промежуточных объектов Path
+    bot_dir_str = os.fspath(bot_dir)
+    for file_name, content in ((start_file, main_content),
+                               ("requirements.txt", requirements_content),
+                               ("README.md", readme_content)):
+        # O_EXCL: создаем файл только если его нет, без отдельной проверки exists()
+        try:
+            fd = os.open(os.path.join(bot_dir_str, file_name), os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0), 0o644)
+        except FileExistsError:
+            continue
+        try:
+            os.write(fd, content)
+        finally:
+            os.close(fd)
 
 def save_bot_metric(bot_id: int, cpu_percent: float, memory_mb: float) -> bool:
     """Сохранение метрики бота"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            INSERT INTO bot_metrics (bot_id, cpu_percent, memory_mb, timestamp)
-            VALUES (?, ?, ?, CURRENT_TIMESTAMP)
-        """, (bot_id, cpu_percent, memory_mb))
-        conn.commit()
-        conn.close()
-        
-        # Удаляем старые метрики (старше 7 дней)
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            DELETE FROM bot_metrics 
-            WHERE timestamp < datetime('now', '-7 days')
-        """)
-        conn.commit()
-        conn.close()
+        with get_write_connection() as conn:
+            conn.execute("""
+                INSERT INTO bot_metrics (bot_id, cpu_percent, memory_mb, timestamp)
+                VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+            """, (bot_id, cpu_percent, memory_mb))
+            
+            # Удаляем старые метрики (старше 7 дней)
+            conn.execute("""
+                DELETE FROM bot_metrics 
+                WHERE timestamp < datetime('now', '-7 days')
+            """)
         
         return True
     except Exception as e:
-        import logging
-        logging.error(f"Ошибка сохранения метрики бота {bot_id}: {e}")
+        logger.error(f"Ошибка сохранения метрики бота {bot_id}: {e}")
         return False
 
 def get_bot_metrics(bot_id: int, hours: int = 24) -> List[Dict]:
     """Получение метрик бота за указанный период"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT cpu_percent, memory_mb, timestamp
-            FROM bot_metrics
-            WHERE bot_id = ? AND timestamp >= datetime('now', '-' || ? || ' hours')
-            ORDER BY timestamp ASC
-        """, (bot_id, hours))
-        
-        rows = cursor.fetchall()
-        conn.close()
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT cpu_percent, memory_mb, timestamp
+                FROM bot_metrics
+                WHERE bot_id = ? AND timestamp >= datetime('now', '-' || ? || ' hours')
+                ORDER BY timestamp ASC
+            """, (bot_id, hours))
+            rows = cursor.fetchall()
         
         return [
             {
@@ -784,9 +1300,5 @@ def get_bot_metrics(bot_id: int, hours: int = 24) -> List[Dict]:
             for row in rows
         ]
     except Exception as e:
-        import logging
-        logging.error(f"Ошибка получения метрик бота {bot_id}: {e}")
+        logger.error(f"Ошибка получения метрик бота {bot_id}: {e}")
         return []
-
-# Инициализируем БД при импорте
-init_database()
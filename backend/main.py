@@ -9,16 +9,18 @@ from starlette.exceptions import HTTPException as StarletteHTTPException
 from pydantic import BaseModel
 from typing import Optional, List
 from pathlib import Path
+import asyncio
 import shutil
 import os
 import zipfile
 import tempfile
 
 from backend.config import BASE_DIR, set_admin_password_hash, get_admin_password_hash
-from backend.auth import verify_password, create_session_token, get_session_from_request
+from backend.auth import verify_password_async, create_session_token, get_session_from_request
 from backend.database import (
-    create_bot, get_bot, get_all_bots, update_bot, delete_bot,
-    save_bot_metric, get_bot_metrics
+    create_bot, get_bot, update_bot, delete_bot,
+    save_bot_metric, get_bot_metrics, aget_bot, aget_all_bots, get_running_bots,
+    read_bot_config, write_bot_config, sanitize_name
 )
 from backend.bot_manager import start_bot, stop_bot, get_bot_process_info, is_process_running
 from backend.sqlite_manager import (
@@ -26,7 +28,8 @@ from backend.sqlite_manager import (
     create_table, drop_table, insert_row, update_row, delete_row,
     add_column, drop_column, update_column, get_databases as get_sqlite_databases,
     create_database as create_sqlite_database, delete_database as delete_sqlite_database,
-    import_database, export_database_db, export_database_sql, export_table_sql
+    import_database, export_database_db, export_database_sql, export_table_sql,
+    get_bot_sqlite_db_path, get_table_count
 )
 from backend.git_manager import (
     update_panel_from_git, update_bot_from_git,
@@ -277,7 +280,7 @@ async def wiki_page(request: Request):
 # API роуты
 @app.post("/api/login")
 async def login(login_data: LoginRequest, response: Response):
-    if verify_password(login_data.password):
+    if await verify_password_async(login_data.password):
         token = create_session_token()
         response.set_cookie(
             key="panel_session",
@@ -300,7 +303,7 @@ async def check_auth(request: Request):
 @app.get("/api/bots")
 async def list_bots():
     from backend.database import calculate_uptime
-    bots = get_all_bots()
+    bots = await aget_all_bots()
     
     # Синхронизируем статусы ботов с реальными процессами
     from datetime import datetime
@@ -324,7 +327,9 @@ async def list_bots():
 @app.post("/api/bots")
 async def create_bot_endpoint(bot_data: BotCreate):
     try:
-        bot_id = create_bot(
+        # Создание директории, config.json и шаблонов - блокирующий ввод-вывод, выполняем в потоке
+        bot_id = await asyncio.to_thread(
+            create_bot,
             name=bot_data.name,
             bot_type=bot_data.bot_type,
             start_file=bot_data.start_file,
@@ -393,10 +398,13 @@ async def create_bot_endpoint(bot_data: BotCreate):
 @app.get("/api/bots/{bot_id}")
 async def get_bot_endpoint(bot_id: int):
     from backend.database import calculate_uptime
-    bot = get_bot(bot_id)
+    bot = await aget_bot(bot_id)
     if not bot:
         raise HTTPException(status_code=404, detail="Бот не найден")
     
+    # Строку БД преобразуем в dict только для ответа
+    bot = dict(bot)
+    
     # Добавляем информацию о времени работы
     if bot['status'] == 'running' and bot.get('started_at'):
         bot['uptime'] = calculate_uptime(bot['started_at'])
@@ -418,7 +426,8 @@ async def update_bot_endpoint(bot_id: int, bot_data: BotUpdate):
 
 @app.delete("/api/bots/{bot_id}")
 async def delete_bot_endpoint(bot_id: int):
-    success = delete_bot(bot_id)
+    # Удаление директории бота уходит в фоновый поток после DELETE
+    success = await asyncio.to_thread(delete_bot, bot_id)
     if not success:
         raise HTTPException(status_code=404, detail="Бот не найден")
     return {"success": True}
@@ -918,7 +927,7 @@ async def download_bot_archive(bot_id: int):
         raise HTTPException(status_code=404, detail="Директория бота не найдена")
     
     # Создаем безопасное имя файла из имени бота
-    safe_bot_name = "".join(c if c.isalnum() or c in ('_', '-') else '_' for c in bot['name'])
+    safe_bot_name = sanitize_name(bot['name'])
     if not safe_bot_name:
         safe_bot_name = f"bot_{bot_id}"
     
@@ -1137,7 +1146,7 @@ async def stop_bot_endpoint(bot_id: int):
 
 @app.get("/api/bots/{bot_id}/status")
 async def get_bot_status(bot_id: int):
-    bot = get_bot(bot_id)
+    bot = await aget_bot(bot_id)
     if not bot:
         raise HTTPException(status_code=404, detail="Бот не найден")
     
@@ -1223,9 +1232,6 @@ async def get_sqlite_databases_endpoint(bot_id: int):
         raise HTTPException(status_code=404, detail="Бот не найден")
     
     try:
-        from backend.sqlite_manager import get_bot_sqlite_db_path, get_tables
-        import os
-        
         db_names = get_sqlite_databases(bot_id)
         databases = []
         
@@ -1236,13 +1242,8 @@ async def get_sqlite_databases_endpoint(bot_id: int):
                 size_bytes = os.path.getsize(db_path) if db_path.exists() else 0
                 size_mb = round(size_bytes / (1024 * 1024), 2)
                 
-                # Получаем количество таблиц
-                table_count = 0
-                try:
-                    tables = get_tables(bot_id, db_name)
-                    table_count = len(tables) if tables else 0
-                except Exception:
-                    pass
+                # Получаем количество таблиц (одним запросом к sqlite_master, без подсчета строк)
+                table_count = get_table_count(bot_id, db_name)
                 
                 databases.append({
                     "db_name": db_name,
@@ -1963,14 +1964,12 @@ async def clone_bot_repository(bot_id: int):
                 if config_path.exists():
                     # Читаем существующий конфиг из клонированного репозитория
                     try:
-                        with open(config_path, 'r', encoding='utf-8') as f:
-                            new_config = json.load(f)
+                        new_config = read_bot_config(config_path)
                     except (json.JSONDecodeError, FileNotFoundError):
                         new_config = {}
                     
                     # Читаем бэкап с нашими настройками
-                    with open(config_backup, 'r', encoding='utf-8') as f:
-                        existing_config = json.load(f)
+                    existing_config = read_bot_config(Path(config_backup))
                     
                     # Сохраняем важные настройки из бэкапа
                     for key in ['name', 'bot_type', 'start_file', 'cpu_limit', 'memory_limit', 'git_repo_url', 'git_branch']:
@@ -1978,8 +1977,7 @@ async def clone_bot_repository(bot_id: int):
                             new_config[key] = existing_config[key]
                     
                     # Сохраняем обновленный конфиг
-                    with open(config_path, 'w', encoding='utf-8') as f:
-                        json.dump(new_config, f, ensure_ascii=False, indent=2)
+                    write_bot_config(config_path, new_config)
                 else:
                     # Если config.json не существует, просто восстанавливаем из бэкапа
                     shutil.copy2(config_backup, config_path)
@@ -2397,7 +2395,7 @@ async def get_panel_ssh_key_info():
 async def change_password(request: Request, password_data: ChangePasswordRequest):
     """Смена пароля администратора"""
     # Проверяем текущий пароль
-    if not verify_password(password_data.current_password):
+    if not await verify_password_async(password_data.current_password):
         raise HTTPException(status_code=401, detail="Текущий пароль неверен")
     
     # Проверяем, что новый пароль не пустой
@@ -2424,37 +2422,64 @@ async def monitor_bots():
         try:
             await asyncio.sleep(30)  # Проверяем каждые 30 секунд
             
-            bots = get_all_bots()
-            for bot in bots:
-                if bot['status'] == 'running' and bot['pid']:
-                    # Проверяем, действительно ли процесс запущен
-                    if not is_process_running(bot['pid']):
-                        logger.warning(f"Bot {bot['id']} ({bot['name']}) crashed, attempting auto-restart...")
-                        # Обновляем статус
-                        update_bot(bot['id'], pid=None, status='stopped')
-                        # Пытаемся перезапустить
-                        try:
-                            success, error = start_bot(bot['id'])
-                            if success:
-                                logger.info(f"Bot {bot['id']} ({bot['name']}) auto-restarted successfully")
-                            else:
-                                logger.error(f"Failed to auto-restart bot {bot['id']}: {error}")
-                                update_bot(bot['id'], status='error')
-                        except Exception as e:
-                            logger.error(f"Exception during auto-restart of bot {bot['id']}: {e}", exc_info=True)
+            for bot_id, bot_name, pid in get_running_bots():
+                # Проверяем, действительно ли процесс запущен
+                if not is_process_running(pid):
+                    logger.warning(f"Bot {bot_id} ({bot_name}) crashed, attempting auto-restart...")
+                    # Обновляем статус
+                    update_bot(bot_id, pid=None, status='stopped')
+                    # Пытаемся перезапустить
+                    try:
+                        success, error = start_bot(bot_id)
+                        if success:
+                            logger.info(f"Bot {bot_id} ({bot_name}) auto-restarted successfully")
+                        else:
+                            logger.error(f"Failed to auto-restart bot {bot_id}: {error}")
+                            update_bot(bot_id, status='error')
+                    except Exception as e:
+                        logger.error(f"Exception during auto-restart of bot {bot_id}: {e}", exc_info=True)
         except Exception as e:
             logger.error(f"Error in bot monitor: {e}", exc_info=True)
             await asyncio.sleep(60)  # При ошибке ждем дольше
 
+async def cpu_sampler():
+    """Фоновая задача для пакетного замера CPU всех запущенных ботов"""
+    import asyncio
+    from backend.bot_manager import start_cpu_sampling, finish_cpu_sampling
+    
+    while True:
+        try:
+            pids = [pid for _, _, pid in get_running_bots()]
+            # Замеряем все процессы на одном интервале 0.5 секунды
+            processes = start_cpu_sampling(pids)
+            await asyncio.sleep(0.5)
+            finish_cpu_sampling(processes)
+        except Exception as e:
+            logger.error(f"Error in CPU sampler: {e}", exc_info=True)
+        await asyncio.sleep(5)
+
+async def db_maintenance():
+    """Фоновая задача периодического обслуживания БД панели"""
+    import asyncio
+    from backend.database import optimize_database
+    
+    while True:
+        await asyncio.sleep(15 * 60)  # Каждые 15 минут
+        try:
+            await asyncio.to_thread(optimize_database)
+        except Exception as e:
+            logger.error(f"Error in DB maintenance: {e}", exc_info=True)
+
 @app.on_event("startup")
 async def startup_event():
     """Восстановление состояния ботов при запуске панели"""
     # Инициализируем базу данных (гарантируем создание таблиц)
-    from backend.database import init_database
+    from backend.database import init_database, init_async_database
     init_database()
+    await init_async_database()
     
     from backend.bot_manager import restore_bot_states
-    restore_bot_states()
+    await restore_bot_states()
     
     # Убеждаемся, что SSH ключ существует при запуске
     try:
@@ -2503,8 +2528,17 @@ async def startup_event():
     # Запускаем фоновую задачу для мониторинга и автоперезапуска ботов
     import asyncio
     asyncio.create_task(monitor_bots())
+    asyncio.create_task(cpu_sampler())
+    asyncio.create_task(db_maintenance())
     logger.info("Bot monitoring task started")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Закрытие соединений с БД при остановке панели"""
+    from backend.database import close_async_database, close_database
+    await close_async_database()
+    close_database()
+
 if __name__ == "__main__":
     import uvicorn
     from backend.config import PANEL_HOST, PANEL_PORT
@@ -4,10 +4,12 @@
 import sqlite3
 import json
 import random
+import re
 import string
 import time
 import shutil
 import tempfile
+import traceback
 from pathlib import Path
 from typing import List, Dict, Optional, Any, Tuple
 from backend.database import get_bot
@@ -16,6 +18,16 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# Максимум строк, возвращаемых execute_sql для SELECT
+MAX_SELECT_ROWS = 10000
+_FETCH_BATCH_SIZE = 1000
+
+# Допустимые имена таблиц и столбцов
+_IDENTIFIER_RE = re.compile(r'[a-zA-Z_][a-zA-Z0-9_\-]*')
+# Допустимые имена файлов БД: буквы (в т.ч. Unicode, как str.isalnum), цифры, '_', '.', '-'
+# и хотя бы одна буква или цифра (имена вроде '..' или '_' не допускаются)
+_DB_NAME_RE = re.compile(r'(?=.*[^\W_])[\w.-]+')
+
 def get_bot_sqlite_db_path(bot_id: int, db_name: str = "bot.db") -> Path:
     """Получение пути к SQLite БД бота"""
     bot = get_bot(bot_id)
@@ -34,6 +46,31 @@ def get_sqlite_connection(bot_id: int, db_name: str = "bot.db") -> sqlite3.Conne
     conn.row_factory = sqlite3.Row
     return conn
 
+def _count_table_rows(cursor: sqlite3.Cursor, table_names: List[str]) -> Dict[str, int]:
+    """Количество строк во всех таблицах одним запросом (UNION ALL вместо запроса на каждую таблицу)"""
+    if not table_names:
+        return {}
+
+    parts = []
+    for name in table_names:
+        quoted = name.replace('"', '""')
+        parts.append(f"SELECT ? AS name, COUNT(*) AS count FROM \"{quoted}\"")
+    try:
+        cursor.execute(" UNION ALL ".join(parts), table_names)
+        return {row['name']: row['count'] for row in cursor.fetchall()}
+    except sqlite3.Error:
+        # Одна из таблиц не читается (например, виртуальная без модуля) - считаем по отдельности
+        counts = {}
+        for name in table_names:
+            quoted = name.replace('"', '""')
+            try:
+                cursor.execute(f"SELECT COUNT(*) AS count FROM \"{quoted}\"")
+                count_row = cursor.fetchone()
+                counts[name] = count_row['count'] if count_row else 0
+            except sqlite3.Error:
+                counts[name] = 0
+        return counts
+
 def get_tables(bot_id: int, db_name: str = "bot.db") -> List[Dict[str, Any]]:
     """Получение списка таблиц в БД"""
     try:
@@ -60,20 +97,15 @@ def get_tables(bot_id: int, db_name: str = "bot.db") -> List[Dict[str, Any]]:
                 ORDER BY name
             """)
             
+            table_rows = cursor.fetchall()
+            row_counts = _count_table_rows(cursor, [row['name'] for row in table_rows])
+
             tables = []
-            for row in cursor.fetchall():
-                # Получаем количество строк в таблице
-                try:
-                    cursor.execute(f"SELECT COUNT(*) as count FROM {row['name']}")
-                    count_row = cursor.fetchone()
-                    row_count = count_row['count'] if count_row else 0
-                except Exception:
-                    row_count = 0
-                
+            for row in table_rows:
                 tables.append({
                     'name': row['name'],
                     'type': row['type'],
-                    'row_count': row_count
+                    'row_count': row_counts.get(row['name'], 0)
                 })
             
             conn.close()
@@ -87,6 +119,26 @@ def get_tables(bot_id: int, db_name: str = "bot.db") -> List[Dict[str, Any]]:
         # В любом случае возвращаем пустой список, чтобы не ломать UI
         return []
 
+def get_table_count(bot_id: int, db_name: str = "bot.db") -> int:
+    """Количество таблиц в БД (без подсчета строк, как в get_tables)"""
+    try:
+        db_path = get_bot_sqlite_db_path(bot_id, db_name)
+        if not db_path.exists():
+            return 0
+
+        conn = get_sqlite_connection(bot_id, db_name)
+        try:
+            row = conn.execute("""
+                SELECT COUNT(*) FROM sqlite_master
+                WHERE type='table' AND name NOT LIKE 'sqlite_%'
+            """).fetchone()
+            return row[0] if row else 0
+        finally:
+            conn.close()
+    except Exception as e:
+        logger.warning(f"Error counting tables for bot {bot_id}, db {db_name}: {e}")
+        return 0
+
 def get_table_structure(bot_id: int, table_name: str, db_name: str = "bot.db") -> Dict[str, Any]:
     """Получение структуры таблицы"""
     try:
@@ -208,11 +260,16 @@ def execute_sql(bot_id: int, query: str, db_name: str = "bot.db") -> Dict[str, A
             cursor.execute(query)
             rows = []
             column_names = [description[0] for description in cursor.description] if cursor.description else []
-            for row in cursor.fetchall():
-                row_dict = {}
-                for i, col_name in enumerate(column_names):
-                    row_dict[col_name] = row[i]
-                rows.append(row_dict)
+            # Читаем порциями и не больше MAX_SELECT_ROWS строк, чтобы SELECT по большой таблице
+            # не загружал весь результат в память
+            truncated = False
+            while len(rows) < MAX_SELECT_ROWS:
+                batch = cursor.fetchmany(min(_FETCH_BATCH_SIZE, MAX_SELECT_ROWS - len(rows)))
+                if not batch:
+                    break
+                rows.extend(dict(zip(column_names, row)) for row in batch)
+            else:
+                truncated = cursor.fetchone() is not None
             
             conn.close()
             return {
@@ -220,7 +277,8 @@ def execute_sql(bot_id: int, query: str, db_name: str = "bot.db") -> Dict[str, A
                 'type': 'select',
                 'columns': column_names,
                 'rows': rows,
-                'affected_rows': len(rows)
+                'affected_rows': len(rows),
+                'truncated': truncated
             }
         else:
             # Для INSERT, UPDATE, DELETE, CREATE, ALTER, DROP
@@ -262,8 +320,7 @@ def create_table(bot_id: int, table_name: str, columns: List,
             return {'success': False, 'error': 'Имя таблицы не может быть пустым'}
         
         # Проверяем, что имя содержит только допустимые символы
-        import re
-        if not re.match(r'^[a-zA-Z_][a-zA-Z0-9_\-]*$', table_name):
+        if not _IDENTIFIER_RE.fullmatch(table_name):
             return {'success': False, 'error': 'Недопустимое имя таблицы. Используйте только буквы, цифры, подчеркивания и дефисы. Имя должно начинаться с буквы или подчеркивания.'}
         
         # Формируем SQL для создания таблицы
@@ -288,7 +345,7 @@ def create_table(bot_id: int, table_name: str, columns: List,
                             continue
                         
                         # Валидация имени столбца
-                        if not re.match(r'^[a-zA-Z_][a-zA-Z0-9_\-]*$', col_name):
+                        if not _IDENTIFIER_RE.fullmatch(col_name):
                             logger.warning(f"Invalid column name: {col_name}")
                             continue
                         
@@ -327,7 +384,6 @@ def create_table(bot_id: int, table_name: str, columns: List,
         return result
     except Exception as e:
         logger.error(f"Error creating table: {e}", exc_info=True)
-        import traceback
         error_trace = traceback.format_exc()
         logger.error(f"Traceback: {error_trace}")
         return {'success': False, 'error': f'Ошибка создания таблицы: {str(e)}'}
@@ -349,15 +405,14 @@ def insert_row(bot_id: int, table_name: str, data: Dict[str, Any],
             return {'success': False, 'error': 'Данные для вставки не предоставлены'}
         
         # Валидация имени таблицы
-        import re
-        if not table_name or not re.match(r'^[a-zA-Z_][a-zA-Z0-9_\-]*$', table_name):
+        if not table_name or not _IDENTIFIER_RE.fullmatch(table_name):
             return {'success': False, 'error': 'Недопустимое имя таблицы'}
         
         # Валидация имен столбцов
         columns = []
         values = []
         for col_name, value in data.items():
-            if not col_name or not re.match(r'^[a-zA-Z_][a-zA-Z0-9_\-]*$', col_name):
+            if not col_name or not _IDENTIFIER_RE.fullmatch(col_name):
                 logger.warning(f"Invalid column name skipped: {col_name}")
                 continue
             columns.append(col_name)
@@ -405,7 +460,6 @@ def insert_row(bot_id: int, table_name: str, data: Dict[str, Any],
             return {'success': False, 'error': f'Ошибка базы данных: {error_msg}'}
     except Exception as e:
         logger.error(f"Error inserting row: {e}", exc_info=True)
-        import traceback
         error_trace = traceback.format_exc()
         logger.error(f"Traceback: {error_trace}")
         return {'success': False, 'error': f'Ошибка добавления строки: {str(e)}'}
@@ -731,7 +785,6 @@ def _generate_unique_db_name(bot_id: int, base_name: str = "bot") -> str:
             return db_name
     
     # Если не удалось сгенерировать за 100 попыток, используем timestamp
-    import time
     timestamp = int(time.time()) % 100000
     return f"{base_name}_{timestamp}.db"
 
@@ -745,7 +798,7 @@ def create_database(bot_id: int, db_name: Optional[str] = None) -> Dict[str, Any
         else:
             # Валидация имени
             db_name_clean = db_name.strip()
-            if not db_name_clean.replace('_', '').replace('.', '').replace('-', '').isalnum():
+            if not _DB_NAME_RE.fullmatch(db_name_clean):
                 return {'success': False, 'error': 'Недопустимое имя базы данных. Используйте только буквы, цифры, дефисы и подчеркивания.'}
             
             if not db_name_clean.endswith('.db'):
@@ -799,7 +852,6 @@ def _parse_sql_file(sql_file_path: str) -> List[str]:
             content = f.read()
         
         # Удаляем комментарии /* */ (многострочные)
-        import re
         content = re.sub(r'/\*.*?\*/', '', content, flags=re.DOTALL)
         
         # Разбиваем на строки и удаляем комментарии --
@@ -871,8 +923,6 @@ def import_database(bot_id: int, source_db_path: str, target_db_name: Optional[s
         Dict с результатом операции
     """
     try:
-        import shutil
-        
         source_path = Path(source_db_path)
         if not source_path.exists():
             return {'success': False, 'error': 'Исходный файл не найден'}
@@ -905,7 +955,7 @@ def import_database(bot_id: int, source_db_path: str, target_db_name: Optional[s
             else:
                 # Валидация имени
                 target_db_name_clean = target_db_name.strip()
-                if not target_db_name_clean.replace('_', '').replace('.', '').replace('-', '').isalnum():
+                if not _DB_NAME_RE.fullmatch(target_db_name_clean):
                     return {'success': False, 'error': 'Недопустимое имя базы данных. Используйте только буквы, цифры, дефисы и подчеркивания.'}
                 
                 if not target_db_name_clean.endswith('.db'):
@@ -1047,7 +1097,7 @@ def _import_from_sql_file(bot_id: int, sql_file_path: Path, target_db_name: Opti
                     target_db_name = _generate_unique_db_name(bot_id)
             else:
                 target_db_name_clean = target_db_name.strip()
-                if not target_db_name_clean.replace('_', '').replace('.', '').replace('-', '').isalnum():
+                if not _DB_NAME_RE.fullmatch(target_db_name_clean):
                     return {'success': False, 'error': 'Недопустимое имя базы данных. Используйте только буквы, цифры, дефисы и подчеркивания.'}
                 
                 if not target_db_name_clean.endswith('.db'):
@@ -1315,6 +1315,9 @@ async function executeQuery() {
                     });
                     
                     html += '</tbody></table>';
+                    if (result.truncated) {
+                        html += `<div class="alert alert-warning" style="margin: 0;">Показаны первые ${result.rows.length} строк</div>`;
+                    }
                 } else {
                     html = '<div class="results-empty"><i class="fas fa-inbox"></i><p>Нет результатов</p></div>';
                 }
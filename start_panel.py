@@ -1,18 +1,21 @@
 """
 Скрипт запуска панели управления ботами
 """
+import asyncio
 import sys
 from pathlib import Path
 
 BASE_DIR = Path(__file__).parent
 sys.path.insert(0, str(BASE_DIR))
 
+from backend.database import init_database
 from backend.bot_manager import restore_bot_states
 from backend.main import app
 from backend.config import PANEL_HOST, PANEL_PORT
 import uvicorn
 
 if __name__ == "__main__":
-    restore_bot_states()
+    init_database()
+    asyncio.run(restore_bot_states())
     uvicorn.run(app, host=PANEL_HOST, port=PANEL_PORT)
 
@@ -0,0 +1,75 @@
+"""
+Тесты работы с БД панели в памяти (PANEL_DB=:memory:)
+"""
+import os
+import threading
+import unittest
+
+# Переменные окружения задаются до импорта backend.config
+os.environ["PANEL_DB"] = ":memory:"
+os.environ.setdefault("ADMIN_PASSWORD_HASH", "test")
+
+from backend import database
+
+
+class MemoryDatabaseConcurrencyTest(unittest.TestCase):
+    """Чтение из другого потока при открытой транзакции записи"""
+
+    def setUp(self):
+        # close_database удаляет БД в памяти - каждый тест начинает с пустой схемы
+        database.close_database()
+        database.init_database()
+        with database.write_transaction() as cursor:
+            cursor.execute(
+                "INSERT INTO bots (name, bot_type, bot_dir) VALUES (?, ?, ?)",
+                ("test", "telegram", "/tmp/bot_test"),
+            )
+            self.bot_id = cursor.lastrowid
+        database._invalidate_bot_cache()
+
+    def tearDown(self):
+        database.close_database()
+
+    def test_read_waits_for_write_transaction(self):
+        result = {}
+
+        def reader():
+            try:
+                result['bot'] = database.get_bot(self.bot_id)
+            except Exception as e:
+                result['error'] = e
+
+        with database.write_transaction() as cursor:
+            cursor.execute("UPDATE bots SET status = 'running' WHERE id = ?", (self.bot_id,))
+            thread = threading.Thread(target=reader)
+            thread.start()
+            # Читатель не должен завершиться ошибкой "database table is locked", пока открыта транзакция
+            thread.join(0.2)
+        thread.join(5)
+
+        self.assertFalse(thread.is_alive())
+        self.assertNotIn('error', result)
+        self.assertEqual(result['bot']['name'], "test")
+        self.assertEqual(result['bot']['status'], "running")
+
+    def test_read_all_bots_from_thread(self):
+        result = {}
+
+        def reader():
+            try:
+                result['bots'] = database.get_all_bots()
+            except Exception as e:
+                result['error'] = e
+
+        with database.write_transaction():
+            thread = threading.Thread(target=reader)
+            thread.start()
+            thread.join(0.2)
+        thread.join(5)
+
+        self.assertNotIn('error', result)
+        self.assertEqual([bot['id'] for bot in result['bots']], [self.bot_id])
+
+
+if __name__ == "__main__":
+    unittest.main()